@@ -0,0 +1,61 @@
+"""Compares two benchmark JSON files, exits with 1 on regressions
+
+    python benchmarks/compare.py base.json new.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+KEY = ("platform", "threads", "averaging", "cells")
+
+
+def seconds(value):
+    # timings are stored as statistics or plain seconds
+    return value["median"] if isinstance(value, dict) else value
+
+
+def timings(entry):
+    # seconds and throughputs in MB/s
+    return {name: seconds(value) for name, value in entry.items() if name.endswith("_s")}
+
+
+def slowdown(name, old, current):
+    """Ratio above 1 if current is slower, throughputs are inverted"""
+    return old / current if name.endswith("_mb_s") else current / old
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as regression")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    pairs = [("loading", timings(base["loading"]), timings(new["loading"]))]
+    results = {tuple(r[k] for k in KEY): r for r in base["results"]}
+    for result in new["results"]:
+        key = tuple(result[k] for k in KEY)
+        if key in results:
+            pairs.append((" ".join(str(k) for k in key), timings(results[key]), timings(result)))
+
+    print(f"{base['meta']['commit']} -> {new['meta']['commit']}")
+    regressions = 0
+    for name, old, current in pairs:
+        for timing in sorted(set(old) & set(current)):
+            ratio = slowdown(timing, old[timing], current[timing])
+            mark = ""
+            if ratio > 1 + args.threshold:
+                mark = "  REGRESSION"
+                regressions += 1
+            print(f"{name:<30} {timing:<20} {old[timing]:>12.6f} {current[timing]:>12.6f} {ratio:>8.3f}{mark}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import numpy as np
+
+# gamma-U lattice constant, angstrom
+U_LATTICE = 3.47
+U_MASS = 238.03
+XE_MASS = 131.29
+# Boltzmann constant, J/K
+K_B = 1.380649e-23
+AMU = 1.66053906660e-27
+
+
+def bcc(cells: int, a: float = U_LATTICE):
+    """Sites of cells^3 BCC box"""
+    grid = np.stack(np.meshgrid(*[np.arange(cells)] * 3, indexing="ij"), axis=-1).reshape(-1, 3).astype(float)
+    return np.concatenate([grid, grid + 0.5]) * a
+
+
+def bubble_lattice(cells: int, radius: float, xe_spacing: float = 3.0, temperature: float = 300.0, seed: int = 0):
+    """BCC U box with spherical Xe bubble in its center
+
+    U atoms within radius are replaced by Xe on a simple cubic grid of xe_spacing.
+    Returns arrays in the layout of SimulationData.set_arrays (angstrom, angstrom/ps, amu),
+    type 1 is U and type 2 is Xe.
+    """
+    rng = np.random.default_rng(seed)
+    length = cells * U_LATTICE
+    center = np.full(3, length / 2)
+
+    uranium = bcc(cells)
+    uranium = uranium[np.linalg.norm(uranium - center, axis=1) > radius]
+
+    side = np.arange(-radius, radius + 1e-9, xe_spacing)
+    xenon = np.stack(np.meshgrid(side, side, side, indexing="ij"), axis=-1).reshape(-1, 3)
+    xenon = xenon[np.linalg.norm(xenon, axis=1) < radius - xe_spacing / 2] + center
+
+    positions = np.concatenate([uranium, xenon])
+    types = np.concatenate([np.ones(len(uranium), int), np.full(len(xenon), 2)])
+    masses = np.where(types == 1, U_MASS, XE_MASS)
+
+    # Maxwell-Boltzmann velocities without drift, m/s -> angstrom/ps
+    velocities = rng.normal(size=positions.shape) * np.sqrt(K_B * temperature / (masses * AMU))[:, None] / 100
+    velocities -= np.average(velocities, axis=0, weights=masses)
+
+    return {
+        "cell": np.eye(3) * length,
+        "positions": positions,
+        "velocities": velocities,
+        "masses": masses,
+        "types": types,
+    }
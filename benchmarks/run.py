@@ -0,0 +1,208 @@
+"""Benchmarks of setup, averaging window, dump, checkpoint and config loading
+
+Runs on synthetic BCC U boxes with a Xe bubble, results are stored as JSON
+for comparison across commits with compare.py, e.g.
+
+    python benchmarks/run.py --cells 6 8 10 --threads 1 2 4 --output bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "plugins", "openmm")]
+
+import numpy as np
+import openmm as mm
+import openmm.unit as un
+
+from edward2 import SimulationData
+import trajectory
+import checkpoint
+from thermo import ThermoSink
+from state import State
+from kernel import Kernel
+from plugin import Plugin
+from common import STRUCTURE_KEYS
+
+from lattice import bubble_lattice
+
+
+# LJ with minimum at BCC U nearest neighbour distance
+SIGMA = 0.267 * un.nanometer
+EPSILON = 1.0 * un.kilojoule_per_mole
+CUTOFF = 0.6 * un.nanometer
+TIME_STEP = 0.001 * un.picoseconds
+
+
+# dump of openmm plugin, imported as kernel does
+OPENMM = Plugin(os.path.join(ROOT, "plugins", "openmm"))
+OPENMM.import_module()
+dump = OPENMM.module.dump
+
+
+def timed(function, repeat):
+    """Seconds of repeated calls"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def stats(times):
+    return {"median": statistics.median(times), "min": min(times), "repeat": len(times)}
+
+
+def make_simulation(structure, platform_name, threads, device_averaging):
+    data = SimulationData()
+    data.set_arrays(*(structure[key] for key in STRUCTURE_KEYS))
+    data.add_lj_force(SIGMA, EPSILON, CUTOFF)
+    integrator = mm.LangevinMiddleIntegrator(300 * un.kelvin, 1 / un.picosecond, TIME_STEP)
+    integrator.setRandomNumberSeed(1)
+    data.set_integrator(integrator)
+    properties = {"Threads": str(threads)} if platform_name == "CPU" else {}
+    return data.make_simulation(platform_name, properties, device_averaging)
+
+
+def bench_simulation(structure, platform_name, threads, averaging, args, directory):
+    result = {}
+
+    start = time.perf_counter()
+    simulation = make_simulation(structure, platform_name, threads, averaging == "device")
+    result["setup_s"] = time.perf_counter() - start
+
+    # warm up kernels and neighbour lists
+    simulation.mean_next(args.average_steps)
+    window = timed(lambda: simulation.mean_next(args.average_steps), args.repeat)
+    result["window_s"] = stats(window)
+    result["step_s"] = result["window_s"]["median"] / args.average_steps
+    result["ns_day"] = TIME_STEP.value_in_unit(un.nanosecond) / result["step_s"] * 86400
+
+    # per frame dump of the last window
+    u, t, P, T, p, v, s = simulation.mean_next(args.average_steps)
+    cell = s.getPeriodicBoxVectors(asNumpy=True).value_in_unit(un.angstrom)
+    for backend in args.backends:
+        path = os.path.join(directory, f"dump_{backend}")
+        writer = trajectory.open_writer(backend, path + "_{i}.lmp" if backend == "lammps" else path, structure["types"])
+        with ThermoSink(os.path.join(directory, f"thermo_{backend}.csv"), simulation.thermo_columns()) as therm:
+            steps = iter(range(0, 10 ** 9, args.average_steps))
+            times = timed(lambda: dump(therm, writer, p, v, u, t, P, T, next(steps), cell), args.repeat)
+        writer.close()
+        result[f"dump_{backend}_s"] = stats(times)
+        result[f"dump_{backend}_mb_s"] = (p.nbytes + v.nbytes) / 1e6 / result[f"dump_{backend}_s"]["median"]
+
+    # checkpoint created and written
+    manager = checkpoint.CheckpointManager(os.path.join(directory, "{i}.chk"), keep_last=1)
+    steps = iter(range(10 ** 9))
+    result["checkpoint_s"] = stats(timed(lambda: (manager.save(simulation.context, next(steps)), manager.wait()), args.repeat))
+    manager.close()
+
+    return result
+
+
+def bench_loading(args, directory):
+    """Config parse with and without cache, kernel start up without plugin imports"""
+    config = os.path.join(directory, "config.yaml")
+    with open(config, "w") as f:
+        f.write("plugins: [tree, openmm, lammps]\nsequence:\n")
+        for i in range(args.sequence):
+            f.write(f"- tree.chmod: {{pairs: [{directory}/x{i}: \"644\"], strict: false}}\n")
+
+    def kernel():
+        kernel = Kernel(config, config_cache=True)
+        kernel.load()
+        kernel.check()
+
+    return {
+        "sequence": args.sequence,
+        "parse_s": stats(timed(lambda: State().load(config), args.repeat)),
+        "parse_cached_s": stats(timed(lambda: State().load(config, cache=True), args.repeat)),
+        "kernel_s": stats(timed(kernel, args.repeat)),
+        "import_openmm_s": OPENMM.import_time,
+    }
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.datetime.now().isoformat(),
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "openmm": mm.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def print_curves(results):
+    """ns/day over atom count and threads"""
+    for platform_name in sorted({r["platform"] for r in results}):
+        for averaging in sorted({r["averaging"] for r in results}):
+            rows = [r for r in results if r["platform"] == platform_name and r["averaging"] == averaging]
+            if not rows:
+                continue
+            threads = sorted({r["threads"] for r in rows})
+            print(f"\n{platform_name}, {averaging} averaging, ns/day")
+            print(f"{'atoms':>10}" + "".join(f"{f'{n} threads':>14}" for n in threads))
+            for atoms in sorted({r["atoms"] for r in rows}):
+                values = {r["threads"]: r["ns_day"] for r in rows if r["atoms"] == atoms}
+                print(f"{atoms:>10}" + "".join(f"{values.get(n, float('nan')):>14.3f}" for n in threads))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cells", type=int, nargs="+", default=[6, 8, 10], help="BCC cells per box side")
+    parser.add_argument("--radius", type=float, default=0.25, help="bubble radius as fraction of box side")
+    parser.add_argument("--platforms", nargs="+", default=["CPU"], choices=["CPU", "Reference"])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1], help="CPU platform threads")
+    parser.add_argument("--averaging", nargs="+", default=["host"], choices=["host", "device"])
+    parser.add_argument("--backends", nargs="+", default=["lammps", "npy"], help="trajectory backends of dump")
+    parser.add_argument("--average-steps", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sequence", type=int, default=1000, help="sequence length of loading benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench.json")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        loading = bench_loading(args, directory)
+
+        for cells in args.cells:
+            structure = bubble_lattice(cells, args.radius * cells * 3.47, seed=args.seed)
+            for platform_name in args.platforms:
+                for threads in args.threads if platform_name == "CPU" else [1]:
+                    for averaging in args.averaging:
+                        result = {
+                            "platform": platform_name,
+                            "threads": threads,
+                            "averaging": averaging,
+                            "cells": cells,
+                            "atoms": len(structure["types"]),
+                            "xe": int((structure["types"] == 2).sum()),
+                        }
+                        result.update(bench_simulation(structure, platform_name, threads, averaging, args, directory))
+                        results.append(result)
+                        print(f"{platform_name} {threads} threads {averaging} {result['atoms']} atoms: {result['ns_day']:.3f} ns/day")
+
+    with open(args.output, "w") as f:
+        json.dump({"meta": metadata(), "arguments": vars(args), "loading": loading, "results": results}, f, indent=1)
+
+    print_curves(results)
+
+
+if __name__ == "__main__":
+    main()
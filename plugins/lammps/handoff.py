@@ -0,0 +1,36 @@
+import numpy as np
+
+from common import STRUCTURE_KEYS
+
+
+def cell_matrix(lmp):
+    """Cell vectors as columns, as OVITO stores them"""
+    boxlo, boxhi, xy, yz, xz, periodicity, box_change = lmp.extract_box()
+    lx, ly, lz = np.subtract(boxhi, boxlo)
+    return np.array([
+        [lx, xy, xz],
+        [0.0, ly, yz],
+        [0.0, 0.0, lz],
+    ])
+
+
+def extract(lmp):
+    """Structure of running LAMMPS instance, atoms sorted by id"""
+    count = lmp.get_natoms()
+    # gather_atoms collects atoms of all ranks ordered by id
+    positions = np.ctypeslib.as_array(lmp.gather_atoms("x", 1, 3)).reshape(count, 3)
+    velocities = np.ctypeslib.as_array(lmp.gather_atoms("v", 1, 3)).reshape(count, 3)
+    types = np.ctypeslib.as_array(lmp.gather_atoms("type", 0, 1)).copy()
+
+    if lmp.extract_setting("rmass_flag"):
+        masses = np.ctypeslib.as_array(lmp.gather_atoms("rmass", 1, 1)).copy()
+    else:
+        # per type masses, index 0 is unused
+        masses = np.asarray(lmp.numpy.extract_atom("mass"))[types]
+
+    return dict(zip(STRUCTURE_KEYS, (cell_matrix(lmp), positions.copy(), velocities.copy(), masses, types)))
+
+
+def save(path, structure):
+    """Writes structure as binary intermediate file"""
+    np.savez(path, **structure)
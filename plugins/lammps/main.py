@@ -1,12 +1,49 @@
+import json
 import subprocess
+import runner
+import handoff
 
 
 def main(**data):
     # save file
-    with open(data["script_save"], "w") as write, open(data["script"]) as read:
-        write.write(read.read().format(**data["variables"]))
+    runner.render(data["script"], data["script_save"], data["variables"])
          
     # run LAMMPS
     subprocess.call(f"{data['executable']} -in {data['script_save']} -log {data['log']} -screen none".split())
     
-    
\ No newline at end of file
+    
+def python(state=None, **data):
+    """Runs script with LAMMPS Python module and hands final structure to next entries"""
+    from lammps import lammps
+    
+    # save file
+    runner.render(data["script"], data["script_save"], data["variables"])
+    
+    # run LAMMPS in process
+    lmp = lammps(cmdargs=["-log", data["log"], "-screen", "none"])
+    try:
+        lmp.file(data["script_save"])
+        structure = handoff.extract(lmp)
+    finally:
+        lmp.close()
+    
+    # share arrays in memory and optionally as binary file
+    if data.get("structure") is not None:
+        state.share(data["structure"], structure)
+    if data.get("structure_file") is not None:
+        handoff.save(data["structure_file"], structure)
+    
+    
+def jobs(**data):
+    # keys outside of jobs are defaults of every job
+    defaults = {key: value for key, value in data.items() if key not in ("jobs", "cores", "timing", "poll_interval", "strict")}
+    job_list = [runner.Job(str(job.get("name", i)), {**defaults, **job}) for i, job in enumerate(data["jobs"])]
+    
+    # run LAMMPS jobs within core budget
+    timings = runner.run(job_list, data.get("cores"), data.get("poll_interval", 0.5))
+    
+    for timing in timings:
+        print(f"{timing['job']}: {timing['wall_seconds']:.1f} s on {timing['cores']} cores, {timing['thermo_rows']} thermo rows")
+    if data.get("timing") is not None:
+        with open(data["timing"], "w") as f:
+            json.dump(timings, f, indent=1)
@@ -0,0 +1,243 @@
+import csv
+import glob
+import os
+import shlex
+import subprocess
+import time
+
+
+def render(script, script_save, variables):
+    # save file
+    with open(script_save, "w") as write, open(script) as read:
+        write.write(read.read().format(**variables))
+
+
+class ThermoParser:
+    """Parses thermo blocks of a LAMMPS log line by line"""
+
+    def __init__(self):
+        self.columns = None
+        self.run = -1
+
+    def feed(self, line):
+        """Returns row dictionary for thermo lines, None otherwise"""
+        words = line.split()
+        if not words:
+            return None
+        if words[0] == "Step":
+            # header of a new thermo block
+            self.columns = words
+            self.run += 1
+            return None
+        if self.columns is None:
+            return None
+        if words[0] == "Loop":
+            self.columns = None
+            return None
+        if len(words) != len(self.columns):
+            return None
+        try:
+            values = [float(word) for word in words]
+        except ValueError:
+            return None
+        return {"run": self.run, **dict(zip(self.columns, values))}
+
+
+class Job:
+    """One LAMMPS run with its log tail and thermo table
+
+    Parquet thermo is a directory of chunks named <first>-<last>.parquet by row
+    number, written every thermo_flush_rows rows, after thermo_flush_seconds, when
+    columns change and at the end.
+    """
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self.mpi = int(data.get("mpi", 1))
+        self.omp = int(data.get("omp", 1))
+        self.cores = self.mpi * self.omp
+        self.parser = ThermoParser()
+        self.process = None
+        self.log = None
+        self.buffer = ""
+        self.table = None
+        self.writer = None
+        self.rows = 0
+        # rows of the next parquet chunk, numbered from 0
+        self.parquet_rows = []
+        self.parquet_first = 0
+        self.last_flush = time.monotonic()
+        self.start = self.end = None
+
+    def command(self):
+        command = shlex.split(self.data["executable"])
+        if self.mpi > 1:
+            command = shlex.split(self.data.get("launcher", "mpirun -np {np}").format(np=self.mpi)) + command
+        command += ["-in", self.data["script_save"], "-log", self.data["log"]]
+        if self.omp > 1 or self.data.get("suffix") is not None:
+            suffix = self.data.get("suffix", "omp")
+            command += ["-sf", suffix]
+            if suffix == "omp":
+                command += ["-pk", "omp", str(self.omp)]
+        if self.data.get("screen") is None:
+            command += ["-screen", "none"]
+        return command
+
+    def launch(self):
+        render(self.data["script"], self.data["script_save"], self.data["variables"])
+
+        env = dict(os.environ, OMP_NUM_THREADS=str(self.omp))
+        # remove stale log so that tail reads this run only
+        if os.path.exists(self.data["log"]):
+            os.remove(self.data["log"])
+        if self.data.get("thermo_parquet") is not None:
+            os.makedirs(self.data["thermo_parquet"], exist_ok=True)
+            for filename in glob.glob(os.path.join(self.data["thermo_parquet"], "*-*.parquet")):
+                os.remove(filename)
+        screen = open(self.data["screen"], "w") if self.data.get("screen") is not None else subprocess.DEVNULL
+        self.start = time.perf_counter()
+        self.process = subprocess.Popen(self.command(), env=env, stdout=screen, stderr=subprocess.STDOUT)
+        if screen is not subprocess.DEVNULL:
+            screen.close()
+
+    def poll(self):
+        """Parses new log lines, returns exit code if finished"""
+        code = self.process.poll()
+        self.read_log()
+        if code is not None:
+            self.end = time.perf_counter()
+            self.read_log(final=True)
+            self.close()
+        return code
+
+    def read_log(self, final=False):
+        if self.log is None:
+            if not os.path.exists(self.data["log"]):
+                return
+            self.log = open(self.data["log"])
+
+        self.buffer += self.log.read()
+        lines = self.buffer.split("\n")
+        # keep incomplete last line until it is written
+        self.buffer = "" if final else lines.pop()
+        for line in lines:
+            row = self.parser.feed(line)
+            if row is not None:
+                self.write_row(row)
+
+    def write_row(self, row):
+        self.rows += 1
+        if self.data.get("thermo_parquet") is not None:
+            if self.parquet_rows and row.keys() != self.parquet_rows[0].keys():
+                self.flush_parquet()
+            self.parquet_rows.append(row)
+            if len(self.parquet_rows) >= self.data.get("thermo_flush_rows", 100) or time.monotonic() - self.last_flush >= self.data.get("thermo_flush_seconds", 30):
+                self.flush_parquet()
+        if self.data.get("thermo_csv") is None:
+            return
+        if self.writer is None or list(row.keys()) != self.writer.fieldnames:
+            # block with other columns goes to a file of its own, thermo.<run>.csv
+            path = self.data["thermo_csv"]
+            if self.table is not None:
+                self.table.close()
+                root, ext = os.path.splitext(path)
+                path = f"{root}.{int(row['run'])}{ext}"
+            self.table = open(path, "w", newline="")
+            self.writer = csv.DictWriter(self.table, fieldnames=list(row.keys()))
+            self.writer.writeheader()
+        self.writer.writerow(row)
+        self.table.flush()
+
+    def flush_parquet(self):
+        self.last_flush = time.monotonic()
+        if not self.parquet_rows:
+            return
+
+        import pandas as pd
+
+        table = pd.DataFrame(self.parquet_rows)
+        for name in ("run", "Step"):
+            if name in table:
+                table[name] = table[name].astype("int64")
+        last = self.parquet_first + len(self.parquet_rows) - 1
+        filename = os.path.join(self.data["thermo_parquet"], f"{self.parquet_first}-{last}.parquet")
+        table.to_parquet(f"{filename}.tmp")
+        os.replace(f"{filename}.tmp", filename)
+        self.parquet_first = last + 1
+        self.parquet_rows = []
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+        if self.table is not None:
+            self.table.close()
+        if self.data.get("thermo_parquet") is not None:
+            self.flush_parquet()
+
+    def terminate(self):
+        """Stops running process and closes outputs"""
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.process is not None:
+            self.close()
+
+    def timing(self):
+        return {
+            "job": self.name,
+            "cores": self.cores,
+            "returncode": self.process.returncode,
+            "wall_seconds": self.end - self.start,
+            "thermo_rows": self.rows,
+        }
+
+
+def run(jobs, cores=None, poll_interval=0.5):
+    """Runs jobs concurrently within core budget, returns their timings
+
+    The first failed job stops launching new jobs, RuntimeError is raised
+    when running jobs finish. Running jobs are terminated if a job cannot be
+    launched.
+    """
+    cores = cores or os.cpu_count()
+    pending = list(jobs)
+    running = []
+    finished = []
+    failed = None
+    used = 0
+
+    while running or (pending and failed is None):
+        # launch jobs which fit into free cores, a too big job runs alone
+        if failed is None:
+            for job in list(pending):
+                if used + job.cores <= cores or not running:
+                    try:
+                        job.launch()
+                    except Exception:
+                        # no unattended jobs after a failed launch
+                        for other in running:
+                            other.terminate()
+                        raise
+                    running.append(job)
+                    used += job.cores
+                    pending.remove(job)
+
+        time.sleep(poll_interval)
+        for job in list(running):
+            code = job.poll()
+            if code is None:
+                continue
+            running.remove(job)
+            finished.append(job)
+            used -= job.cores
+            if code != 0 and failed is None:
+                failed = job
+
+    if failed is not None:
+        raise RuntimeError(f"LAMMPS job \"{failed.name}\" exited with code {failed.process.returncode}")
+    return [job.timing() for job in finished]
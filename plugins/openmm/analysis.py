@@ -0,0 +1,163 @@
+import collections
+import multiprocessing as mp
+import queue
+import threading
+import importlib.util as iu
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# averaged frame passed to analysis, arrays must not be modified
+Frame = collections.namedtuple("Frame", ["step", "positions", "velocities", "types", "cell", "thermo"])
+
+# end of stream
+_END = None
+
+
+def load_function(path, function):
+    # load module
+    spec = iu.spec_from_file_location("analysis", path)
+    module = iu.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    # get entry point
+    return getattr(module, function)
+
+
+def _iterate(get):
+    while True:
+        item = get()
+        if item is _END:
+            return
+        yield item
+
+
+class ThreadStream:
+    """Passes frames to analysis function in a thread, arrays are shared without copy"""
+
+    def __init__(self, function, types, cell, buffers=2):
+        self.types = types
+        self.cell = cell
+        self.queue = queue.Queue(maxsize=buffers)
+        self.error = None
+        self.finished = False
+
+        self.thread = threading.Thread(target=self.run, args=(function,), name="analysis", daemon=True)
+        self.thread.start()
+
+    def get(self):
+        item = self.queue.get()
+        self.finished = item is _END
+        return item
+
+    def run(self, function):
+        try:
+            function(_iterate(self.get))
+        except BaseException as e:
+            self.error = e
+        # drop frames not consumed by analysis to unblock producer
+        while not self.finished:
+            self.get()
+
+    def send(self, step, positions, velocities, thermo):
+        if self.error is not None:
+            raise RuntimeError("Analysis failed") from self.error
+        self.queue.put(Frame(step, positions, velocities, self.types, self.cell, thermo))
+
+    def close(self):
+        self.queue.put(_END)
+        self.thread.join()
+        if self.error is not None:
+            raise RuntimeError("Analysis failed") from self.error
+
+
+def _process_main(path, function, name, buffers, count, types, cell, frames, free):
+    memory = shared_memory.SharedMemory(name=name)
+    slots = np.ndarray((buffers, 2, count, 3), dtype=np.float64, buffer=memory.buf)
+
+    def get():
+        item = frames.get()
+        if item is _END:
+            return _END
+        slot, step, thermo = item
+        # previous slot is released when the next frame is requested
+        if get.slot is not None:
+            free.put(get.slot)
+        get.slot = slot
+        return Frame(step, slots[slot, 0], slots[slot, 1], types, cell, thermo)
+    get.slot = None
+
+    try:
+        load_function(path, function)(_iterate(get))
+    finally:
+        del slots
+        memory.close()
+
+
+class ProcessStream:
+    """Passes frames to analysis function in a separate process through shared memory slots
+
+    Frame arrays are views of a slot which is reused after the next frame is requested.
+    """
+
+    def __init__(self, path, function, types, cell, buffers=2):
+        count = len(types)
+        self.memory = shared_memory.SharedMemory(create=True, size=buffers * 2 * count * 3 * 8)
+        self.slots = np.ndarray((buffers, 2, count, 3), dtype=np.float64, buffer=self.memory.buf)
+
+        self.frames = mp.Queue()
+        self.free = mp.Queue()
+        for slot in range(buffers):
+            self.free.put(slot)
+
+        self.process = mp.Process(
+            target=_process_main,
+            args=(path, function, self.memory.name, buffers, count, np.asarray(types), np.asarray(cell), self.frames, self.free),
+            name="analysis",
+            daemon=True,
+        )
+        self.process.start()
+
+    def send(self, step, positions, velocities, thermo):
+        # blocks until analysis releases a slot
+        while True:
+            try:
+                slot = self.free.get(timeout=1)
+                break
+            except queue.Empty:
+                if self.process.is_alive():
+                    continue
+                if self.process.exitcode != 0:
+                    self.release()
+                    raise RuntimeError(f"Analysis process exited with code {self.process.exitcode}")
+                # analysis finished early
+                return
+        self.slots[slot, 0] = positions
+        self.slots[slot, 1] = velocities
+        self.frames.put((slot, step, thermo))
+
+    def close(self):
+        self.frames.put(_END)
+        self.process.join()
+        self.release()
+        if self.process.exitcode != 0:
+            raise RuntimeError(f"Analysis process exited with code {self.process.exitcode}")
+
+    def release(self):
+        """Frees shared memory slots, once"""
+        if self.memory is None:
+            return
+        del self.slots
+        self.memory.close()
+        self.memory.unlink()
+        self.memory = None
+
+
+def open_stream(path, function, types, cell, mode="thread", buffers=2):
+    """Starts analysis function consuming an iterator of frames"""
+    if mode == "thread":
+        return ThreadStream(load_function(path, function), types, cell, buffers)
+    if mode == "process":
+        return ProcessStream(path, function, types, cell, buffers)
+    raise ValueError(f"Unknown analysis mode \"{mode}\"")
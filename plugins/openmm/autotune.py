@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import hashlib
+import platform
+
+import openmm as mm
+import openmm.unit as unit
+
+from checkpoint import atomic_write
+
+
+CACHE = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "u-xe-bubble", "platforms.json")
+
+
+def cpu_count():
+    """CPUs usable by this process, within affinity and cgroup cpusets"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+def default_threads():
+    count = cpu_count()
+    return sorted({2 ** i for i in range(count.bit_length()) if 2 ** i <= count} | {count})
+
+
+def system_key(system, integrator, candidates, digest=None):
+    """Host, System, integrator type, OpenMM version and candidates of a decision
+
+    digest identifies the System if known, e.g. build cache key, otherwise its XML is hashed.
+    """
+    if digest is None:
+        digest = hashlib.sha256(mm.XmlSerializer.serialize(system).encode()).hexdigest()
+    tried = hashlib.sha256(json.dumps(candidates, sort_keys=True).encode()).hexdigest()
+    return f"{platform.node()}:{type(integrator).__name__}:{mm.__version__}:{digest}:{tried}"
+
+
+def merged(name, properties, user):
+    """Tuned properties with user properties supported by platform, user values win"""
+    supported = mm.Platform.getPlatformByName(name).getPropertyNames()
+    return {**properties, **{key: value for key, value in (user or {}).items() if key in supported}}
+
+
+def candidates(names=None, threads=None, user=None):
+    """(platform, properties) pairs to try, CPU once per thread count"""
+    available = [mm.Platform.getPlatform(i).getName() for i in range(mm.Platform.getNumPlatforms())]
+    pairs = []
+    for name in sorted(available):
+        if names is not None and name not in names:
+            continue
+        if name == "CPU":
+            tuned = [{"Threads": str(n)} for n in sorted(threads or default_threads())]
+        else:
+            tuned = [{}]
+        for properties in tuned:
+            # user Threads leaves a single CPU candidate
+            if (name, merged(name, properties, user)) not in pairs:
+                pairs.append((name, merged(name, properties, user)))
+    return pairs
+
+
+def trial(system, integrator, positions, name, properties, steps):
+    """ns/day of steps on platform, after one warm up step"""
+    # integrator can be bound to one context only
+    integrator = mm.XmlSerializer.deserialize(mm.XmlSerializer.serialize(integrator))
+    context = mm.Context(system, integrator, mm.Platform.getPlatformByName(name), properties)
+    try:
+        context.setPositions(positions)
+        context.setVelocitiesToTemperature(300 * unit.kelvin, 1)
+        integrator.step(1)
+        context.getState(getEnergy=True)
+
+        start = time.perf_counter()
+        integrator.step(steps)
+        # wait for queued device work
+        context.getState(getEnergy=True)
+        elapsed = time.perf_counter() - start
+    finally:
+        del context
+    return steps * integrator.getStepSize().value_in_unit(unit.nanosecond) / elapsed * 86400
+
+
+def choose(system, integrator, positions, steps=50, names=None, threads=None, cache=None, properties=None, digest=None):
+    """Fastest platform and properties for system, decision is cached per host, system and candidates
+
+    properties given by user are kept where a platform supports them.
+    """
+    cache = cache or CACHE
+    tried = candidates(names, threads, properties)
+    key = system_key(system, integrator, tried, digest)
+    try:
+        with open(cache) as f:
+            decisions = json.load(f)
+    except FileNotFoundError:
+        decisions = {}
+    if key in decisions:
+        return decisions[key]["platform"], decisions[key]["properties"]
+
+    trials = []
+    for name, properties in tried:
+        try:
+            trials.append({"platform": name, "properties": properties, "ns_day": trial(system, integrator, positions, name, properties, steps)})
+        except mm.OpenMMException as e:
+            # platform listed but not usable on this node
+            print(f"Platform {name} {properties} failed: {e}")
+            continue
+        print(f"Platform {name} {properties}: {trials[-1]['ns_day']:.3f} ns/day")
+    if not trials:
+        raise RuntimeError("No usable OpenMM platform")
+
+    best = max(trials, key=lambda trial: trial["ns_day"])
+    decisions[key] = {**best, "trials": trials}
+    os.makedirs(os.path.dirname(cache), exist_ok=True)
+    atomic_write(cache, json.dumps(decisions, indent=1).encode())
+    return best["platform"], best["properties"]
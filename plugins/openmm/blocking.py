@@ -0,0 +1,133 @@
+import numpy as np
+
+
+class Welford:
+    """Running mean and variance of scalars or arrays"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean = self.mean + delta / self.count
+        self.m2 = self.m2 + delta * (x - self.mean)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan * self.m2
+
+
+class Blocking:
+    """Flyvbjerg-Petersen block averaging of a correlated series
+
+    Level k holds running variance of means of blocks of 2^k samples and the pending
+    half of the next block, so memory grows with the logarithm of samples only.
+    """
+
+    # blocks needed for a level estimate
+    MIN_BLOCKS = 4
+
+    def __init__(self):
+        self.levels = []
+        self.pending = []
+
+    def add(self, x):
+        level = 0
+        while True:
+            if level == len(self.levels):
+                self.levels.append(Welford())
+                self.pending.append(None)
+            self.levels[level].add(x)
+            if self.pending[level] is None:
+                self.pending[level] = x
+                return
+            x = (self.pending[level] + x) / 2
+            self.pending[level] = None
+            level += 1
+
+    @property
+    def count(self):
+        return self.levels[0].count if self.levels else 0
+
+    @property
+    def mean(self):
+        return self.levels[0].mean if self.levels else np.nan
+
+    def errors(self):
+        """Standard error of the mean and its uncertainty at each level"""
+        errors = []
+        for level in self.levels:
+            if level.count < self.MIN_BLOCKS:
+                break
+            error = np.sqrt(level.variance / level.count)
+            errors.append((error, error / np.sqrt(2 * (level.count - 1))))
+        return errors
+
+    def error(self):
+        """Standard error at the first level where the next one agrees within error bars"""
+        errors = self.errors()
+        if not errors:
+            return np.nan
+        for (error, uncertainty), (following, _) in zip(errors, errors[1:]):
+            if following - error < uncertainty:
+                return error
+        # no plateau yet, largest estimate is the safest
+        return max(error for error, _ in errors)
+
+    def tau(self):
+        """Integrated autocorrelation time in samples, from statistical inefficiency"""
+        variance = self.levels[0].variance if self.levels else np.nan
+        if not variance > 0:
+            return np.nan
+        return (self.count * self.error() ** 2 / variance - 1) / 2
+
+
+class Statistics:
+    """Streaming mean, standard error and autocorrelation time of thermo columns
+
+    Samples are dump rows, tau is given in steps of interval per row. rmsf is the root
+    mean square fluctuation of averaged positions in angstrom. With targets the
+    statistics are converged once every target column has a standard error below its
+    target.
+    """
+
+    def __init__(self, observables, interval, positions=True, targets=None, min_rows=10):
+        self.observables = list(observables)
+        self.interval = interval
+        self.blocking = [Blocking() for _ in self.observables]
+        self.positions = Welford() if positions else None
+        self.targets = targets or {}
+        self.min_rows = min_rows
+        unknown = set(self.targets) - set(self.observables)
+        if unknown:
+            raise ValueError(f"Unknown statistics target columns {sorted(unknown)}")
+
+    def columns(self):
+        columns = [f"{name}_{kind}" for name in self.observables for kind in ("mean", "sem", "tau")]
+        return columns + (["rmsf"] if self.positions is not None else [])
+
+    def add(self, row, positions=None):
+        """Adds thermo row by column name and averaged positions, returns extra thermo values"""
+        for name, blocking in zip(self.observables, self.blocking):
+            blocking.add(row[name])
+        if self.positions is not None and positions is not None:
+            self.positions.add(positions)
+        return self.values()
+
+    def values(self):
+        values = []
+        for blocking in self.blocking:
+            values += [blocking.mean, blocking.error(), blocking.tau() * self.interval]
+        if self.positions is not None:
+            rmsf = np.sqrt(self.positions.variance.sum(axis=1).mean()) if self.positions.count > 1 else np.nan
+            values.append(rmsf)
+        return values
+
+    def converged(self):
+        if not self.targets or self.blocking[0].count < self.min_rows:
+            return False
+        errors = {name: blocking.error() for name, blocking in zip(self.observables, self.blocking)}
+        return all(errors[name] < target for name, target in self.targets.items())
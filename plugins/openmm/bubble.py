@@ -0,0 +1,143 @@
+import numpy as np
+import scipy.constants
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+
+# extra thermo columns
+COLUMNS = ("xe_clusters", "bubble_xe", "bubble_radius", "bubble_density", "bubble_pressure", "vacancies", "interstitials")
+
+
+def bcc_sites(cells, a, offset):
+    grid = np.stack(np.meshgrid(*[np.arange(n) for n in cells], indexing="ij"), axis=-1).reshape(-1, 3).astype(float)
+    return np.concatenate([grid, grid + 0.5]) * a + offset
+
+
+def lattice_offset(positions, a):
+    """Origin of BCC lattice from atom positions, both sublattices coincide modulo a / 2"""
+    phase = positions % (a / 2) / (a / 2) * 2 * np.pi
+    offset = np.angle(np.exp(1j * phase).mean(axis=0)) % (2 * np.pi) / (2 * np.pi) * (a / 2)
+
+    # modulo a / 2 leaves half period shifts, choose the one fitting positions
+    best = None
+    for shift in np.vstack([np.zeros(3), np.eye(3) * a / 2]):
+        delta = (positions - offset - shift) / a
+        # distance to nearest site of either sublattice
+        error = np.minimum(
+            np.abs(delta - np.rint(delta)).sum(axis=1),
+            np.abs(delta - 0.5 - np.rint(delta - 0.5)).sum(axis=1),
+        ).mean()
+        if best is None or error < best[0]:
+            best = (error, offset + shift)
+    return best[1]
+
+
+def carnahan_starling(density, temperature, diameter):
+    """Hard sphere pressure in GPa, density in 1/angstrom^3, diameter in angstrom"""
+    eta = np.pi / 6 * density * diameter ** 3
+    z = (1 + eta + eta ** 2 - eta ** 3) / (1 - eta) ** 3
+    return density * 1e30 * scipy.constants.k * temperature * z / 1e9
+
+
+class BubbleAnalysis:
+    """Xe bubble observables of averaged frames
+
+    U atoms are assigned to the nearest site of a reference BCC lattice (Wigner-Seitz
+    analysis), empty sites next to the largest Xe cluster form the bubble and the
+    other empty sites are vacancies. The bubble pressure is the Carnahan-Starling
+    pressure of Xe at the bubble density and kinetic temperature. Site and cluster
+    assignments are recomputed only for atoms which moved more than skin.
+    """
+
+    def __init__(self, types, cell, positions, u_type=1, xe_type=2, lattice_constant=3.47,
+                 cluster_cutoff=5.0, xe_diameter=4.0, skin=0.1, reference=None):
+        cell = np.asarray(cell)
+        if np.count_nonzero(cell - np.diag(np.diag(cell))):
+            raise ValueError("Bubble analysis supports orthogonal cells only")
+
+        self.box = np.diag(cell).copy()
+        self.uranium = np.flatnonzero(np.asarray(types) == u_type)
+        self.xenon = np.flatnonzero(np.asarray(types) == xe_type)
+        self.a = lattice_constant
+        self.cluster_cutoff = cluster_cutoff
+        self.xe_diameter = xe_diameter
+        self.skin = skin
+
+        # reference lattice, static tree reused by all frames
+        if reference is None:
+            cells = np.rint(self.box / self.a).astype(int)
+            sites = bcc_sites(cells, self.a, lattice_offset(positions[self.uranium], self.a))
+        else:
+            sites = np.load(reference)["positions"]
+        self.sites = self.wrap(sites)
+        self.site_tree = cKDTree(self.sites, boxsize=self.box)
+
+        # site of each U atom and count of U atoms on each site
+        self.u_positions = self.wrap(positions[self.uranium])
+        self.u_sites = self.site_tree.query(self.u_positions)[1]
+        self.occupancy = np.bincount(self.u_sites, minlength=len(self.sites))
+
+        # Xe clusters
+        self.xe_positions = None
+        self.labels = None
+
+    def wrap(self, positions):
+        positions = np.asarray(positions) % self.box
+        # rounding of small negative coordinates gives box length
+        return np.where(positions >= self.box, 0.0, positions)
+
+    def moved(self, old, new):
+        delta = new - old
+        delta -= np.rint(delta / self.box) * self.box
+        return np.flatnonzero(np.einsum("ij,ij->i", delta, delta) > self.skin ** 2)
+
+    def update_sites(self, positions):
+        positions = self.wrap(positions[self.uranium])
+        moved = self.moved(self.u_positions, positions)
+        if len(moved) == 0:
+            return
+
+        sites = self.site_tree.query(positions[moved])[1]
+        np.subtract.at(self.occupancy, self.u_sites[moved], 1)
+        np.add.at(self.occupancy, sites, 1)
+        self.u_sites[moved] = sites
+        self.u_positions[moved] = positions[moved]
+
+    def update_clusters(self, positions):
+        positions = self.wrap(positions[self.xenon])
+        if self.labels is not None and len(self.moved(self.xe_positions, positions)) == 0:
+            return
+
+        self.xe_positions = positions
+        tree = cKDTree(positions, boxsize=self.box)
+        pairs = tree.query_pairs(self.cluster_cutoff, output_type="ndarray")
+        graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(len(positions),) * 2)
+        self.count, self.labels = connected_components(graph, directed=False)
+
+    def __call__(self, positions, kinetic_energy):
+        """Extra thermo values of frame, kinetic energy in kJ/mol"""
+        self.update_sites(positions)
+
+        empty = np.flatnonzero(self.occupancy == 0)
+        interstitials = np.clip(self.occupancy - 1, 0, None).sum()
+        if len(self.xenon) == 0:
+            return [0, 0, 0.0, 0.0, 0.0, len(empty), interstitials]
+
+        self.update_clusters(positions)
+        largest = np.bincount(self.labels).argmax()
+        bubble = self.xe_positions[self.labels == largest]
+
+        # empty sites within a lattice constant of bubble Xe atoms
+        distance = cKDTree(bubble, boxsize=self.box).query(self.sites[empty], distance_upper_bound=self.a)[0]
+        in_bubble = np.count_nonzero(np.isfinite(distance))
+
+        # atomic volume of BCC
+        volume = in_bubble * self.a ** 3 / 2
+        radius = (3 * volume / (4 * np.pi)) ** (1 / 3)
+        density = len(bubble) / volume if volume > 0 else 0.0
+        temperature = 2 * kinetic_energy * 1000 / (3 * (len(positions)) * scipy.constants.R)
+        pressure = carnahan_starling(density, temperature, self.xe_diameter) if volume > 0 else 0.0
+
+        # Xe/nm^3
+        return [self.count, len(bubble), radius, density * 1000, pressure, len(empty) - in_bubble, interstitials]
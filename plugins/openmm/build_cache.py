@@ -0,0 +1,51 @@
+import gzip
+import hashlib
+import json
+import os
+
+import numpy as np
+import openmm as mm
+
+from checkpoint import atomic_write
+from common import update_file
+
+
+def build_key(configuration, forces):
+    """Hash of configuration file or arrays, potential files and force parameters"""
+    if isinstance(configuration, dict):
+        digest = hashlib.sha256()
+        for name in sorted(configuration):
+            digest.update(name.encode())
+            digest.update(np.ascontiguousarray(configuration[name]).tobytes())
+    else:
+        digest = update_file(hashlib.sha256(), configuration)
+    for force in forces:
+        force_type = list(force.keys())[0]
+        if force_type == "Potential":
+            update_file(digest, force[force_type]["potential_path"])
+    digest.update(json.dumps(forces, sort_keys=True, default=str).encode())
+    digest.update(mm.__version__.encode())
+    return digest.hexdigest()
+
+
+def load(directory, key):
+    """Returns cached system and arrays, None if key is not cached"""
+    try:
+        with gzip.open(os.path.join(directory, f"{key}.xml.gz"), "rt") as f:
+            system = mm.XmlSerializer.deserialize(f.read())
+        arrays = dict(np.load(os.path.join(directory, f"{key}.npz")))
+    except FileNotFoundError:
+        return None
+    arrays["system"] = system
+    return arrays
+
+
+def save(directory, key, system, **arrays):
+    """Stores system and arrays (types, masses, cell, positions, velocities)"""
+    os.makedirs(directory, exist_ok=True)
+
+    # arrays first, system file marks complete entry
+    tmp = os.path.join(directory, f"{key}.tmp.npz")
+    np.savez(tmp, **arrays)
+    os.replace(tmp, os.path.join(directory, f"{key}.npz"))
+    atomic_write(os.path.join(directory, f"{key}.xml.gz"), gzip.compress(mm.XmlSerializer.serialize(system).encode(), compresslevel=1))
@@ -0,0 +1,153 @@
+import bz2
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from openmm import unit
+
+
+COMPRESSORS = {
+    None: (lambda data: data, lambda data: data, ""),
+    "gzip": (gzip.compress, gzip.decompress, ".gz"),
+    "bz2": (bz2.compress, bz2.decompress, ".bz2"),
+    "xz": (lzma.compress, lzma.decompress, ".xz"),
+}
+
+
+def config_hash(config):
+    """Hash of a config dictionary"""
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def atomic_write(path, data):
+    """Writes file under temporary name and renames it, so path is never partially written"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def resolve_index(template, index=None):
+    """Index of checkpoints, next to checkpoints of template unless given"""
+    if index is not None:
+        return index
+    if template is None:
+        raise ValueError("Checkpoint index needs checkpoint_index or checkpoint_template")
+    return os.path.join(os.path.dirname(template.format(i=0)), "checkpoints.json")
+
+
+def read_index(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def latest(index_path, digest=None):
+    """Newest valid checkpoint entry in index and its data, None if there is no such entry
+
+    Incomplete, unreadable or corrupted checkpoints are skipped for older ones.
+    """
+    for entry in sorted(read_index(index_path), key=lambda entry: entry["step"], reverse=True):
+        if digest is not None and entry["config_hash"] != digest:
+            continue
+        path = os.path.join(os.path.dirname(index_path), entry["file"])
+        if not os.path.exists(path) or os.path.getsize(path) != entry["size"]:
+            continue
+        try:
+            return entry, load(index_path, entry)
+        except (ValueError, OSError, EOFError, lzma.LZMAError, zlib.error) as e:
+            print(f"Skipping checkpoint \"{entry['file']}\": {e}")
+    return None
+
+
+def load(index_path, entry):
+    """Reads and verifies checkpoint of index entry"""
+    with open(os.path.join(os.path.dirname(index_path), entry["file"]), "rb") as f:
+        data = COMPRESSORS[entry["compression"]][1](f.read())
+    if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+        raise ValueError(f"Corrupted checkpoint \"{entry['file']}\"")
+    return data
+
+
+class CheckpointManager:
+    """Writes checkpoints on a background thread and keeps an index of them
+
+    Keeps the last keep_last checkpoints (all if None) and every checkpoint whose
+    step is a multiple of keep_every.
+    """
+
+    def __init__(self, template, index_path=None, compression=None, keep_last=None, keep_every=None, digest=None):
+        if compression not in COMPRESSORS:
+            raise ValueError(f"Unknown checkpoint compression \"{compression}\"")
+
+        self.template = template
+        self.index_path = resolve_index(template, index_path)
+        self.compression = compression
+        self.keep_last = keep_last
+        self.keep_every = keep_every
+        self.digest = digest
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.futures = []
+
+    def save(self, context, step):
+        """Creates checkpoint on calling thread, writes it in background"""
+        data = context.createCheckpoint()
+        time = context.getTime().value_in_unit(unit.picosecond)
+        # raise errors of finished writes
+        for future in self.futures:
+            if future.done():
+                future.result()
+        self.futures = [future for future in self.futures if not future.done()]
+        self.futures.append(self.executor.submit(self.write, data, step, time))
+
+    def write(self, data, step, time):
+        path = self.template.format(i=step) + COMPRESSORS[self.compression][2]
+        atomic_write(path, COMPRESSORS[self.compression][0](data))
+
+        entry = {
+            "step": step,
+            "time": time,
+            "file": os.path.relpath(path, os.path.dirname(self.index_path)),
+            "size": os.path.getsize(path),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "compression": self.compression,
+            "config_hash": self.digest,
+        }
+        index = [old for old in read_index(self.index_path) if old["step"] != step] + [entry]
+        index.sort(key=lambda entry: entry["step"])
+
+        # retention
+        kept = []
+        removed = []
+        for i, old in enumerate(index):
+            if (self.keep_last is None or i >= len(index) - self.keep_last
+                    or self.keep_every and old["step"] % self.keep_every == 0):
+                kept.append(old)
+            else:
+                removed.append(old)
+
+        # index never points to removed files
+        atomic_write(self.index_path, json.dumps(kept, indent=1).encode())
+        for old in removed:
+            try:
+                os.remove(os.path.join(os.path.dirname(self.index_path), old["file"]))
+            except FileNotFoundError:
+                pass
+
+    def wait(self):
+        """Waits for pending writes, raises their errors"""
+        for future in self.futures:
+            future.result()
+        self.futures = []
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
@@ -1,62 +1,190 @@
+import time
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 
 import openmm
 import openmm.unit as unit
 
 import ovito.io
-import ovito.data
-
-import os
 
 import numpy as np
 
 import scipy
 import scipy.constants
 
+from trajectory import write_lammps_dump
+
+
+# accumulator variables kept on the device by the averaging integrator
+_ACCUMULATORS = ("sum_x", "sum_v", "sum_mv2", "sum_ke")
+
+# pressure modes
+PRESSURE_MODES = (None, "scalar", "tensor")
+# pressure tensor components reported by barostats
+STRESS_COMPONENTS = ("pxx", "pyy", "pzz", "pxy", "pxz", "pyz")
+
+
+def add_particles(target, rows):
+    """Calls target.addParticle for each row, without other per-particle Python work"""
+    deque(map(target.addParticle, rows), maxlen=0)
+
+
+def type_table(values, types):
+    """Per-particle values from a {type: value} mapping via a type-indexed array"""
+    table = np.full(max(max(values), int(types.max())) + 1, np.nan)
+    table[list(values.keys())] = list(values.values())
+    result = table[types]
+    if np.isnan(result).any():
+        missing = np.unique(types[np.isnan(result)])
+        raise KeyError(f"No value for particle types {missing.tolist()}")
+    return result
+
+
+def make_averaging_integrator(integrator):
+    """Rebuilds integrator as CustomIntegrator which also accumulates window sums"""
+    averaging = openmm.CustomIntegrator(integrator.getStepSize())
+    averaging.setConstraintTolerance(integrator.getConstraintTolerance())
+
+    averaging.addGlobalVariable("sum_u", 0)
+    averaging.addGlobalVariable("keep", 0)
+    for name in _ACCUMULATORS:
+        averaging.addPerDofVariable(name, 0)
+    averaging.addPerDofVariable("x1", 0)
+
+    averaging.addUpdateContextState()
+
+    if isinstance(integrator, openmm.VerletIntegrator):
+        # leapfrog, state velocities lag positions by half step
+        averaging.addComputePerDof("v", "v+dt*f/m")
+        averaging.addConstrainVelocities()
+        averaging.addComputePerDof("x1", "x")
+        averaging.addComputePerDof("x", "x+dt*v")
+        averaging.addConstrainPositions()
+        averaging.addComputePerDof("v", "(x-x1)/dt")
+        # same half step shift as VerletIntegrator kinetic energy
+        kinetic = "0.5*m*(v+0.5*dt*f/m)^2"
+    elif isinstance(integrator, openmm.LangevinMiddleIntegrator):
+        friction = integrator.getFriction().value_in_unit(unit.picosecond ** -1)
+        dt = integrator.getStepSize().value_in_unit(unit.picosecond)
+        kT = (unit.MOLAR_GAS_CONSTANT_R * integrator.getTemperature()).value_in_unit(unit.kilojoule_per_mole)
+
+        averaging.addGlobalVariable("a", np.exp(-friction * dt))
+        averaging.addGlobalVariable("b", np.sqrt(1 - np.exp(-2 * friction * dt)))
+        averaging.addGlobalVariable("kT", kT)
+        averaging.setRandomNumberSeed(integrator.getRandomNumberSeed())
+
+        averaging.addComputePerDof("v", "v+dt*f/m")
+        averaging.addConstrainVelocities()
+        averaging.addComputePerDof("x", "x+0.5*dt*v")
+        averaging.addComputePerDof("v", "a*v+b*sqrt(kT/m)*gaussian")
+        averaging.addComputePerDof("x", "x+0.5*dt*v")
+        averaging.addComputePerDof("x1", "x")
+        averaging.addConstrainPositions()
+        averaging.addComputePerDof("v", "v+(x-x1)/dt")
+        kinetic = "0.5*m*v*v"
+    else:
+        raise ValueError(f"Device averaging is not supported for {type(integrator).__name__}")
+
+    # accumulate, keep is 0 on the first step of a window
+    averaging.addComputeGlobal("sum_u", "keep*sum_u+energy")
+    averaging.addComputePerDof("sum_x", "keep*sum_x+x")
+    averaging.addComputePerDof("sum_v", "keep*sum_v+v")
+    averaging.addComputePerDof("sum_mv2", "keep*sum_mv2+m*v*v")
+    averaging.addComputePerDof("sum_ke", f"keep*sum_ke+{kinetic}")
+    averaging.addComputeGlobal("keep", "1")
+
+    return averaging
+
+
+def _strip(value, default_unit):
+    """Splits quantity into contiguous float array and its unit"""
+    if unit.is_quantity(value):
+        return np.ascontiguousarray(value.value_in_unit(value.unit), dtype=float), value.unit
+    return np.ascontiguousarray(value, dtype=float), default_unit
+
 
 class SimulationData:
+    """Simulation setup, frozen after make_simulation
+
+    Cell, positions, velocities and masses are float arrays in cell_unit,
+    length_unit, velocity_unit and mass_unit.
+    """
+
+    __slots__ = (
+        "forces",
+        "cell",
+        "positions",
+        "velocities",
+        "masses",
+        "types",
+        "count",
+        "temperature",
+        "mass",
+        "integrator",
+        "system",
+        "cell_unit",
+        "length_unit",
+        "velocity_unit",
+        "mass_unit",
+    )
+
     def __init__(self):
         self.forces = []
+        self.cell = self.positions = self.velocities = self.masses = self.types = None
+        self.count = self.temperature = self.mass = self.integrator = self.system = None
+        self.cell_unit = self.length_unit = unit.nanometer
+        self.velocity_unit = unit.nanometer / unit.picosecond
+        self.mass_unit = unit.dalton
 
     def read_ovito(self, filename, length_units=unit.angstroms, time_units=unit.picoseconds, mass_units=unit.atom_mass_units):
-        velocity_units = length_units / time_units
-
         data = ovito.io.import_file(filename, sort_particles=True).compute()
 
-        self.set_cell(data.cell[:, :3] * length_units)
-        self.set_pos(data.particles.positions[...] * length_units)
-        self.set_vel(data.particles.velocities[...] * velocity_units)
+        self.set_arrays(
+            data.cell[:, :3],
+            data.particles.positions[...],
+            data.particles.velocities[...],
+            data.particles.masses[...],
+            data.particles.particle_types[...],
+            length_units,
+            time_units,
+            mass_units,
+        )
+
+    def set_arrays(self, cell, positions, velocities, masses, types, length_units=unit.angstroms, time_units=unit.picoseconds, mass_units=unit.atom_mass_units):
+        self.set_cell(cell * length_units)
+        self.set_pos(positions * length_units)
+        self.set_vel(velocities * (length_units / time_units))
 
-        self.masses = data.particles.masses[...] * mass_units
-        self.types = data.particles.particle_types[...]
+        self.masses, self.mass_unit = _strip(masses, mass_units)
+        self.types = np.asarray(types)
 
     def set_cell(self, cell):
-        self.cell = cell
+        self.cell, self.cell_unit = _strip(cell, self.cell_unit)
     
     def set_pos(self, pos):
-        if hasattr(self, "count"):
+        if self.count is not None:
             assert self.count == len(pos)
 
-        self.positions = pos
+        self.positions, self.length_unit = _strip(pos, self.length_unit)
         self.count = len(pos)
 
     def set_vel(self, vel):
-        if hasattr(self, "count"):
+        if self.count is not None:
             assert self.count == len(vel)
 
-        self.velocities = vel
+        self.velocities, self.velocity_unit = _strip(vel, self.velocity_unit)
         self.count = len(vel)
 
     def set_temp(self, temp):
         self.temperature = temp
 
     def set_mass(self, mass):
-        assert not hasattr(self, "masses")
+        assert self.masses is None
 
         self.mass = mass
 
     def set_integrator(self, integrator):
-        assert not hasattr(self, "integrator")
+        assert self.integrator is None
 
         self.integrator = integrator
 
@@ -72,135 +200,232 @@ class SimulationData:
         )
         force.setNonbondedMethod(openmm.CustomNonbondedForce.CutoffPeriodic)
         force.setCutoffDistance(cutoff)
-        for _ in range(self.count):
-            force.addParticle([])
+        add_particles(force, [()] * self.count)
         self.add_force(force)
 
-    def make_simulation(self, platform, properties):
-        try:
-            loaded_platform = openmm.Platform.getPlatformByName(platform)
-        except openmm.OpenMMException:
-            print("Loaded plugins: ", openmm.pluginLoadedLibNames)
-            print("Loading errors: ", openmm.Platform.getPluginLoadFailures())
-            raise
-
-        system = openmm.System()
-        system.setDefaultPeriodicBoxVectors(self.cell[0], self.cell[1], self.cell[2])
-        if hasattr(self, "mass"):
-            for _ in range(self.count):
-                system.addParticle(self.mass)
+    def make_pressure_probe(self, pressure):
+        """Creates barostat which never moves the box, used to compute the virial pressure"""
+        if pressure not in PRESSURE_MODES:
+            raise ValueError(f"Unknown pressure mode \"{pressure}\"")
+        if pressure is None:
+            return None
+
+        temperature = 300 * unit.kelvin if self.temperature is None else self.temperature
+        if pressure == "tensor":
+            barostat = openmm.MonteCarloFlexibleBarostat(1 * unit.bar, temperature, 0)
+            barostat.setScaleMoleculesAsRigid(False)
         else:
-            assert hasattr(self, "masses")
-            for mass in self.masses:
-                system.addParticle(mass)
+            barostat = openmm.MonteCarloBarostat(1 * unit.bar, temperature, 0)
+        return barostat
+
+    def converted(self, name, target_unit):
+        """Array attribute converted to target_unit"""
+        source_unit = {
+            "cell": self.cell_unit,
+            "positions": self.length_unit,
+            "velocities": self.velocity_unit,
+            "masses": self.mass_unit,
+        }[name]
+        return getattr(self, name) * source_unit.conversion_factor_to(target_unit)
+
+    def particle_masses(self):
+        """Masses in daltons as array"""
+        if self.mass is not None:
+            return np.full(self.count, self.mass.value_in_unit(unit.dalton))
+        assert self.masses is not None
+        return self.converted("masses", unit.dalton)
+
+    def set_system(self, system):
+        """Uses prebuilt system, e.g. loaded from build cache"""
+        assert self.system is None
+
+        self.system = system
+
+    def build_system(self):
+        system = openmm.System()
+        system.setDefaultPeriodicBoxVectors(*[openmm.Vec3(*row) for row in self.converted("cell", unit.nanometer)])
+        add_particles(system, self.particle_masses().tolist())
 
         for force in self.forces:
             system.addForce(force)
-                
-        context = openmm.Context(system, self.integrator, loaded_platform, properties)
+
+        return system
+
+    def make_context(self, system, loaded_platform, properties, integrator, device_averaging, barostat, pressure_every, seed=None, temperature=None):
+        if device_averaging:
+            # index 0 is the configured integrator, index 1 averages on device
+            compound = openmm.CompoundIntegrator()
+            compound.addIntegrator(integrator)
+            compound.addIntegrator(make_averaging_integrator(integrator))
+            integrator = compound
+
+        context = openmm.Context(system, integrator, loaded_platform, properties)
         
-        context.setPositions(self.positions)
-        if hasattr(self, 'velocities'):
-            context.setVelocities(self.velocities)
+        # plain arrays are in nm and nm/ps
+        context.setPositions(self.converted("positions", unit.nanometer))
+        if seed is not None:
+            # independent replica
+            context.setVelocitiesToTemperature(self.temperature if temperature is None else temperature, seed)
+        elif self.velocities is not None:
+            context.setVelocities(self.converted("velocities", unit.nanometer / unit.picosecond))
         else:
-            assert hasattr(self, 'temperature')
+            assert self.temperature is not None
             context.setVelocitiesToTemperature(self.temperature)
 
-        simulation = Simulation(context=context, integrator=self.integrator)
+        return Simulation(
+            context=context,
+            integrator=integrator,
+            barostat=barostat,
+            pressure_every=pressure_every,
+            masses=self.particle_masses(),
+        )
+
+    def load_platform(self, platform):
+        try:
+            return openmm.Platform.getPlatformByName(platform)
+        except openmm.OpenMMException:
+            print("Loaded plugins: ", openmm.pluginLoadedLibNames)
+            print("Loading errors: ", openmm.Platform.getPluginLoadFailures())
+            raise
+
+    def make_simulation(self, platform, properties, device_averaging=False, pressure=None, pressure_every=1):
+        loaded_platform = self.load_platform(platform)
+
+        system = self.build_system() if self.system is None else self.system
+        barostat = self.make_pressure_probe(pressure)
+        if barostat is not None:
+            system.addForce(barostat)
+
+        simulation = self.make_context(system, loaded_platform, properties, self.integrator, device_averaging, barostat, pressure_every)
         self.set_tainted(True)
         return simulation
 
+    def make_ensemble(self, platform, properties, integrators, seeds, temperatures, device_averaging=False, pressure=None, pressure_every=1):
+        """Contexts sharing one system, replica velocities are drawn at own temperature and seed"""
+        loaded_platform = self.load_platform(platform)
+
+        system = self.build_system() if self.system is None else self.system
+        barostat = self.make_pressure_probe(pressure)
+        if barostat is not None:
+            system.addForce(barostat)
+
+        simulations = [
+            self.make_context(system, loaded_platform, properties, integrator, device_averaging, barostat, pressure_every, seed, temperature)
+            for integrator, seed, temperature in zip(integrators, seeds, temperatures)
+        ]
+        self.set_tainted(True)
+        return simulations
+
     def set_tainted(self, tainted):
-        self.tainted = tainted
+        # switching class keeps attribute access free until the data is tainted
+        object.__setattr__(self, "__class__", _TaintedSimulationData if tainted else SimulationData)
+
+
+class _TaintedSimulationData(SimulationData):
+    __slots__ = ()
 
     def __getattribute__(self, name):
-        try:
-            if super().__getattribute__('tainted') and name != 'set_tainted':
-                raise RuntimeError("Access to a tainted SimulationData")
-        except AttributeError:
-            pass
-        return super().__getattribute__(name)
+        if name in ("set_tainted", "__class__"):
+            return object.__getattribute__(self, name)
+        raise RuntimeError("Access to a tainted SimulationData")
 
     def __setattr__(self, name, value) -> None:
-        try:
-            if super().__getattribute__('tainted') and name != 'tainted':
-                raise RuntimeError("Access to a tainted SimulationData")
-        except AttributeError:
-            pass
-        return super().__setattr__(name, value)
+        raise RuntimeError("Access to a tainted SimulationData")
 
 
 class Simulation:
-    def __init__(self, context, integrator):
+    def __init__(self, context, integrator, barostat=None, pressure_every=1, masses=None):
         self.context = context
         self.integrator = integrator
         self.executor = ThreadPoolExecutor(max_workers=1)
         self.running = False
-
+        self.device_averaging = isinstance(integrator, openmm.CompoundIntegrator)
+        # zero frequency barostat and sampling interval of pressure
+        self.barostat = barostat
+        self.pressure_every = pressure_every
+        # mean pressure tensor (xx, yy, zz, xy, xz, yz) of the last window, bar
+        self.stress = None
+        # seconds spent in phases since last pop_times, on GPU platforms
+        # queued integration may be counted as state transfer
+        self.times = dict.fromkeys(("integrate", "state_transfer", "pressure"), 0.0)
+
+        # forces are never used on host
         self.get_state_flags = {'getPositions': True,
                                 'getVelocities': True,
                                 'enforcePeriodicBox': False,
-                                'getForces': True,
+                                'getForces': False,
                                 'getEnergy': True,
                                }
         
-        self.masses = np.asarray([context.getSystem().getParticleMass(i).value_in_unit(unit.dalton) / scipy.constants.N_A / 1000 for i in range(context.getSystem().getNumParticles())])
+        # masses in daltons, read from system if not given
+        if masses is None:
+            system = context.getSystem()
+            masses = np.fromiter((system.getParticleMass(i).value_in_unit(unit.dalton) for i in range(system.getNumParticles())), dtype=float)
+        # kg
+        self.masses = np.asarray(masses) / scipy.constants.N_A / 1000
 
     def get_state(self) -> openmm.State:
         assert not self.running
-        return self.context.getState(**self.get_state_flags)
+        start = time.perf_counter()
+        state = self.context.getState(**self.get_state_flags)
+        self.times["state_transfer"] += time.perf_counter() - start
+        return state
 
     def step(self, steps):
         assert not self.running
         self.running = True
+        start = time.perf_counter()
         self.integrator.step(steps)
+        self.times["integrate"] += time.perf_counter() - start
         self.running = False
         return self.get_state()
 
+    def pop_times(self):
+        """Returns phase times and resets them"""
+        times = self.times
+        self.times = dict.fromkeys(times, 0.0)
+        return times
+
     def step_async(self, steps):
         return self.executor.submit(self.step, (steps))
     
-    def dump_ovito(self, state, filename):
-        data = ovito.data.DataCollection()
-
+    def sample_pressure(self):
+        """Instantaneous virial pressure tensor computed on device, bar"""
+        start = time.perf_counter()
+        pressure = self.barostat.computeCurrentPressure(self.context).value_in_unit(unit.bar)
+        self.times["pressure"] += time.perf_counter() - start
+        if isinstance(self.barostat, openmm.MonteCarloFlexibleBarostat):
+            return np.asarray(pressure)
+        return np.asarray([pressure] * 3 + [0] * 3)
+    
+    def mean_stress(self, samples, count):
+        """Saves mean pressure tensor, returns scalar pressure"""
+        if self.barostat is None:
+            return 0
+        self.stress = samples / count
+        return self.stress[:3].mean()
+    
+    def thermo_columns(self):
+        """Columns of thermo output"""
+        columns = ["step", "u", "t", "P", "T"]
+        if isinstance(self.barostat, openmm.MonteCarloFlexibleBarostat):
+            columns += STRESS_COMPONENTS
+        return columns
+    
+    def dump_ovito(self, state, filename, types):
         cell = state.getPeriodicBoxVectors(asNumpy=True).value_in_unit(unit.angstrom)
         positions = state.getPositions(asNumpy=True).value_in_unit(unit.angstrom)
         velocities = state.getVelocities(asNumpy=True).value_in_unit(unit.angstrom / unit.picosecond)
 
-        data_cell = ovito.data.SimulationCell(pbc=(True, True, True))
-        data_cell[:, :3] = cell
-
-        data.objects.append(data_cell)
-
-        particles = ovito.data.Particles()
-        particles.create_property('Position', data=positions)
-        particles.create_property('Velocity', data=velocities)
-        particles.create_property('Particle Type', data=types)
-
-        data.objects.append(particles)
-
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-
-        ovito.io.export_file(
-            data,
-            filename,
-            "lammps/dump",
-            columns=[
-                "Particle Identifier",
-                "Particle Type",
-                "Position.X",
-                "Position.Y",
-                "Position.Z",
-                "Velocity.X",
-                "Velocity.Y",
-                "Velocity.Z"
-            ]
-        )
+        write_lammps_dump(filename, cell, positions, velocities, types)
         
         
     def mean_next(self, steps, ):
         """Means"""
         
+        if self.device_averaging:
+            return self.mean_next_device(steps)
+        
         time_ = self.context.getTime().value_in_unit(unit.second)
         state = self.get_state()
         
@@ -209,10 +434,10 @@ class Simulation:
         u = t = T = P = 0
         positions = np.zeros_like(p)
         velocities = np.zeros_like(v)
+        stress = np.zeros(6)
+        samples = 0
         
-        Gs = []
-
-        for _ in range(steps):
+        for i in range(steps):
             # run 1 step
             state = self.step(1)
             p = state.getPositions(asNumpy=True)
@@ -231,12 +456,9 @@ class Simulation:
             T_ = (self.masses * np.sum(v.value_in_unit(unit.meter / unit.second) ** 2, axis=1)).sum() / scipy.constants.k / N_ * 2 / 3
             T += T_
             
-            V_ = state.getPeriodicBoxVolume().value_in_unit(unit.meter ** 3)
-            bv_ = state.getPeriodicBoxVectors(asNumpy=True).value_in_unit(unit.meter)
-            bv_ = np.asarray([bv_[0][0], bv_[1][1], bv_[2][2]])
-            
-            p_ = 0 #np.fmod(p.value_in_unit(unit.meter) + (abs(int(np.min(p.value_in_unit(unit.meter))))+1) * bv_, bv_)
-            Gs.append((self.masses * np.sum((v.value_in_unit(unit.meter / unit.second) * p_), axis=1)).sum())
+            if self.barostat is not None and (steps - i - 1) % self.pressure_every == 0:
+                stress += self.sample_pressure()
+                samples += 1
         
         time_ = self.context.getTime().value_in_unit(unit.second) - time_
         
@@ -246,12 +468,60 @@ class Simulation:
         u /= steps
         t /= steps
         T /= steps
-        P = 0 # np.polyfit(np.linspace(0, time_, len(Gs)), Gs, 1)[0] / 3 / V_
+        P = self.mean_stress(stress, samples)
+        
+        return u, t, P, T, positions, velocities, state
+
+
+    def mean_next_device(self, steps):
+        """Means accumulated by the averaging integrator, transfers data once per window"""
+        
+        averaging = self.integrator.getIntegrator(1)
+        averaging.setGlobalVariableByName("keep", 0)
+        stress = np.zeros(6)
+        samples = 0
+        
+        assert not self.running
+        self.running = True
+        self.integrator.setCurrentIntegrator(1)
+        try:
+            if self.barostat is None:
+                start = time.perf_counter()
+                self.integrator.step(steps)
+                self.times["integrate"] += time.perf_counter() - start
+            else:
+                # sample pressure between chunks, data stays on device
+                # same sampled steps as host averaging, the last one included
+                every = min(self.pressure_every, steps)
+                chunks = [steps % every] * bool(steps % every) + [every] * (steps // every)
+                for chunk in chunks:
+                    start = time.perf_counter()
+                    self.integrator.step(chunk)
+                    self.times["integrate"] += time.perf_counter() - start
+                    stress += self.sample_pressure()
+                    samples += 1
+        finally:
+            self.integrator.setCurrentIntegrator(0)
+            self.running = False
+        state = self.get_state()
+        
+        start = time.perf_counter()
+        # nm -> angstrom
+        positions = np.asarray(averaging.getPerDofVariableByName("sum_x")) * 10 / steps
+        velocities = np.asarray(averaging.getPerDofVariableByName("sum_v")) * 10 / steps
+        mv2 = np.asarray(averaging.getPerDofVariableByName("sum_mv2")).sum()
+        
+        u = averaging.getGlobalVariableByName("sum_u") / steps
+        t = np.asarray(averaging.getPerDofVariableByName("sum_ke")).sum() / steps
+        self.times["state_transfer"] += time.perf_counter() - start
+        # kJ/mol -> J per particle
+        T = mv2 * 1000 / scipy.constants.N_A / scipy.constants.k / len(positions) * 2 / 3 / steps
+        P = self.mean_stress(stress, samples)
         
         return u, t, P, T, positions, velocities, state
 
 
-    def mean_next_async(self, steps, checkpoint = False):
-        return self.executor.submit(self.mean_next, steps, checkpoint)
+    def mean_next_async(self, steps):
+        return self.executor.submit(self.mean_next, steps)
     
     
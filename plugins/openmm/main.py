@@ -1,40 +1,43 @@
 import os
-import pandas as pd
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import openmm as mm
 from tqdm import tqdm
 import subprocess
 from openmm import unit as un
-from ovito import data as odata
-from ovito import io as oio
 from edward2 import SimulationData
 from edward2 import Simulation
-import importlib.util as iu
+from edward2 import add_particles, type_table
+import trajectory
+from pipeline import DumpPipeline
+import analysis
+import checkpoint
+import build_cache
+from thermo import ThermoSink
+import bubble
+import blocking
+from region import RegionWriter
+import autotune
+from common import STRUCTURE_KEYS
+
+# init keys defining the simulated system, checkpoints of other configs are not loaded
+SYSTEM_KEYS = ("configuration", "structure", "forces", "integrator", "ensemble")
+# outputs written by every replica of an ensemble
+REPLICA_PATH_KEYS = ("thermo", "thermo_columnar_path", "trajectory_template", "trajectory_path", "checkpoint_template", "checkpoint_index")
 
 _types: np.ndarray = None
 _simulation: Simulation = None
 _step = 0
+_config_hash: str = None
+# replicas of ensemble mode, _simulation is the first one
+_replicas: list = None
 
 
-def init(**data):
-    global _types, _simulation, _step
-    
-    # simulation data
-    simulation_data = SimulationData()
-    
-    # load configuration
-    simulation_data.read_ovito(data["configuration"])
-    
-    # load integrator
+def add_forces(simulation_data, forces):
     openmm_module = __import__("openmm")
-    integrator_class = getattr(openmm_module, data["integrator"]["type"])
-    # create integrator
-    integrator = integrator_class(*data["integrator"]["arguments"])
-    # set integrator
-    simulation_data.set_integrator(integrator)
-    
-    # create forces
-    for force in data["forces"]:
+    
+    for force in forces:
         force_type = list(force.keys())[0]
         parameters = force[force_type]
         
@@ -43,8 +46,8 @@ def init(**data):
             with open(parameters["potential_path"], "r") as file_force:
                 force = mm.XmlSerializer.deserialize(file_force.read())
             # add particles
-            for i in range(simulation_data.count):
-                force.addParticle([parameters["particle_types"][simulation_data.types[i]]])
+            values = type_table(parameters["particle_types"], simulation_data.types)
+            add_particles(force, values[:, None].tolist())
         else:
             # create force
             force_class = getattr(openmm_module, force_type)
@@ -52,24 +55,212 @@ def init(**data):
         
         simulation_data.add_force(force)
     
+    
+def make_integrator(integrator):
+    openmm_module = __import__("openmm")
+    integrator_class = getattr(openmm_module, integrator["type"])
+    return integrator_class(*integrator["arguments"])
+
+
+def replica_data(data, r):
+    """Config of replica r, {r} in string values is replaced by replica index"""
+    return {key: value.replace("{r}", str(r)) if isinstance(value, str) else value for key, value in data.items()}
+
+
+def check_replica_paths(data):
+    """Raises ValueError if replicas would share an output path"""
+    for key in REPLICA_PATH_KEYS:
+        if data.get(key) is not None and "{r}" not in data[key]:
+            raise ValueError(f"Ensemble path {key} \"{data[key]}\" must contain {{r}}")
+    # default index is next to checkpoints
+    template = data.get("checkpoint_template")
+    if template is not None and data.get("checkpoint_index") is None and "{r}" not in os.path.dirname(template):
+        raise ValueError("Ensemble needs checkpoint_index with {r} or checkpoint_template with {r} in its directory")
+
+
+def load_checkpoint(simulation, data):
+    """Loads checkpoint selected by config, returns its step"""
+    if data["checkpoint"] == "auto":
+        # newest valid checkpoint of this config
+        # same index as written by simulate
+        found = checkpoint.latest(checkpoint.resolve_index(data.get("checkpoint_template"), data.get("checkpoint_index")), _config_hash)
+        if found is None:
+            return 0
+        entry, state = found
+        simulation.context.loadCheckpoint(state)
+        return entry["step"]
+    elif data["checkpoint"] is not None:
+        with open(data["checkpoint"], "b+r") as f:
+            simulation.context.loadCheckpoint(f.read())
+        return int(os.path.basename(data["checkpoint"]).split(".")[0])
+    return 0
+
+
+def read_structure(simulation_data, structure):
+    """Sets arrays of a structure shared by previous entry or read from .npz file"""
+    simulation_data.set_arrays(*(structure[key] for key in STRUCTURE_KEYS))
+
+
+def init(state=None, **data):
+    global _types, _simulation, _step, _config_hash, _replicas
+    
+    _config_hash = checkpoint.config_hash({key: data.get(key) for key in SYSTEM_KEYS})
+    
+    # simulation data
+    simulation_data = SimulationData()
+    
+    # structure in memory, binary intermediate file or configuration read by OVITO
+    if data.get("structure") is not None:
+        structure = state.shared(data["structure"])
+    elif data["configuration"].endswith(".npz"):
+        structure = dict(np.load(data["configuration"]))
+    else:
+        structure = None
+    
+    # look up configuration and system in build cache
+    cache = data.get("build_cache")
+    cached = None
+    key = None
+    if cache is not None:
+        key = build_cache.build_key(data["configuration"] if structure is None else structure, data["forces"])
+        cached = build_cache.load(cache, key)
+    
+    if cached is not None:
+        simulation_data.set_arrays(cached["cell"], cached["positions"], cached["velocities"], cached["masses"], cached["types"])
+        simulation_data.set_system(cached["system"])
+    else:
+        # load configuration
+        if structure is not None:
+            read_structure(simulation_data, structure)
+        else:
+            simulation_data.read_ovito(data["configuration"])
+        # create forces
+        add_forces(simulation_data, data["forces"])
+        
+        if cache is not None:
+            simulation_data.set_system(simulation_data.build_system())
+            build_cache.save(
+                cache,
+                key,
+                simulation_data.system,
+                cell=simulation_data.converted("cell", un.angstrom),
+                positions=simulation_data.converted("positions", un.angstrom),
+                velocities=simulation_data.converted("velocities", un.angstrom / un.picosecond),
+                masses=simulation_data.converted("masses", un.amu),
+                types=simulation_data.types,
+            )
+    
+    # create and set integrator
+    simulation_data.set_integrator(make_integrator(data["integrator"]))
+    
     # modify HIP properties
     if data["platform_name"] == "HIP":
         os.environ["HIP_VISIBLE_DEVICES"] = data["platform_properties"]["DeviceIndex"]
         data["platform_properties"]["DeviceIndex"] = "0"
     
+    # time platforms on the system, decision is cached per host and system
+    if data["platform_name"] == "auto":
+        choose_platform(simulation_data, data, key)
+    
     # save types
     _types = simulation_data.types
+    
+    if data.get("ensemble") is not None:
+        init_ensemble(simulation_data, data)
+        return
+    
     # save simulation
-    _simulation = simulation_data.make_simulation(data["platform_name"], data["platform_properties"])
+    _simulation = simulation_data.make_simulation(
+        data["platform_name"],
+        data["platform_properties"],
+        device_averaging=data.get("averaging", "host") == "device",
+        pressure=data.get("pressure"),
+        pressure_every=data.get("pressure_every", 1),
+    )
+    _replicas = None
     
     # load checkpoint if necessary
-    if data["checkpoint"] is not None:
-        _step = int(os.path.basename(data["checkpoint"]).split(".")[0])
-        with open(data["checkpoint"], "b+r") as f:
-            _simulation.context.loadCheckpoint(f.read())
+    _step = load_checkpoint(_simulation, data)
+
+
+def choose_platform(simulation_data, data, digest=None):
+    """Sets fastest platform, digest identifies the system if built through build cache"""
+    if simulation_data.system is None:
+        simulation_data.set_system(simulation_data.build_system())
+    
+    threads = data.get("autotune_threads")
+    if threads is None and data.get("ensemble") is not None:
+        # replicas share CPU threads
+        threads = [max(1, autotune.cpu_count() // data["ensemble"]["replicas"])]
+    
+    name, properties = autotune.choose(
+        simulation_data.system,
+        simulation_data.integrator,
+        simulation_data.converted("positions", un.nanometer),
+        steps=data.get("autotune_steps", 50),
+        names=data.get("autotune_platforms"),
+        threads=threads,
+        cache=data.get("autotune_cache"),
+        properties=data.get("platform_properties"),
+        digest=digest,
+    )
+    print(f"Platform {name} {properties}")
+    data["platform_name"] = name
+    data["platform_properties"] = properties
+
+
+def init_ensemble(simulation_data, data):
+    """Creates replicas sharing one system"""
+    global _simulation, _step, _replicas
+    
+    check_replica_paths(data)
+    ensemble = data["ensemble"]
+    count = ensemble["replicas"]
+    seeds = ensemble.get("seeds", list(range(1, count + 1)))
+    if "temperatures" in ensemble:
+        temperatures = ensemble["temperatures"]
+    elif "temperature" in ensemble:
+        temperatures = [ensemble["temperature"]] * count
+    else:
+        raise ValueError("Ensemble needs temperature or temperatures")
+    assert len(seeds) == count and len(temperatures) == count
+    
+    # replica integrators with own temperature and seed
+    integrators = []
+    for seed, temperature in zip(seeds, temperatures):
+        integrator = make_integrator(data["integrator"])
+        if hasattr(integrator, "setTemperature"):
+            integrator.setTemperature(temperature)
+        if hasattr(integrator, "setRandomNumberSeed"):
+            integrator.setRandomNumberSeed(seed)
+        integrators.append(integrator)
+    
+    # share CPU threads between replicas
+    properties = dict(data["platform_properties"])
+    if data["platform_name"] == "CPU" and "Threads" not in properties:
+        properties["Threads"] = str(max(1, os.cpu_count() // count))
+    
+    _replicas = simulation_data.make_ensemble(
+        data["platform_name"],
+        properties,
+        integrators,
+        seeds,
+        [temperature * un.kelvin for temperature in temperatures],
+        device_averaging=data.get("averaging", "host") == "device",
+        pressure=data.get("pressure"),
+        pressure_every=data.get("pressure_every", 1),
+    )
+    _simulation = _replicas[0]
+    
+    # all replicas restart from the same step
+    steps = {load_checkpoint(replica, replica_data(data, r)) for r, replica in enumerate(_replicas)}
+    if len(steps) != 1:
+        raise ValueError(f"Replica checkpoints are at different steps {sorted(steps)}")
+    _step = steps.pop()
             
 
 def dump(therm,
+         writer,
          positions: np.ndarray,
          velocities: np.ndarray,
          u: float,
@@ -78,99 +269,322 @@ def dump(therm,
          T: float,
          step: int,
          cell,
+         stress=None,
+         extra=None,
          **data):
-    """Writes dumps of energies and positions"""
-    
-    therm.write(f"{step},{u},{t},{P},{T}\n")
-    therm.flush()
-    
-    data_collection = odata.DataCollection()
-    
-    # get cell
-    data_cell = odata.SimulationCell(pbc=(True, True, True))
-    data_cell[:, :3] = cell
-
-    # set cell
-    data_collection.objects.append(data_cell)
-
-    # set positions, velocities and types
-    particles = odata.Particles()
-    particles.create_property("Position", data=positions)
-    particles.create_property("Velocity", data=velocities)
-    particles.create_property("Particle Type", data=_types)
-    
-    # add data to data object
-    data_collection.objects.append(particles)
-
-    # export
-    oio.export_file(
-        data_collection,
-        data["trajectory_template"].format(i=step),
-        "lammps/dump",
-        columns=[
-            "Particle Identifier",
-            "Particle Type",
-            "Position.X",
-            "Position.Y",
-            "Position.Z",
-            "Velocity.X",
-            "Velocity.Y",
-            "Velocity.Z",
-        ]
+    """Writes dumps of energies and positions, returns bytes written by trajectory writer"""
+    
+    row = [step, u, t, P, T]
+    if stress is not None:
+        row += list(stress)
+    if extra is not None:
+        row += extra
+    therm.write(row)
+    
+    return writer.write(step, cell, positions, velocities)
+    
+    
+def open_bubble(simulation, data):
+    """Bubble analysis of simulation if configured"""
+    if data.get("bubble") is None:
+        return None
+    state = simulation.get_state()
+    return bubble.BubbleAnalysis(
+        _types,
+        state.getPeriodicBoxVectors(asNumpy=True).value_in_unit(un.angstrom),
+        state.getPositions(asNumpy=True).value_in_unit(un.angstrom),
+        **data["bubble"],
+    )
+
+
+def open_statistics(columns, iter_steps, path, data):
+    """Streaming statistics of thermo columns if configured, restarted runs add rows before restart point"""
+    config = data.get("statistics")
+    if config is None:
+        return None
+    stats = blocking.Statistics(
+        config.get("observables", columns[1:]),
+        iter_steps,
+        config.get("positions", True),
+        config.get("target"),
+        config.get("min_rows", 10),
+    )
+    
+    if _step > 0 and os.path.exists(path):
+        with open(path) as f:
+            header = f.readline().strip().split(",")
+            if set(stats.observables) <= set(header):
+                for line in f:
+                    if line.strip() and int(float(line.split(",", 1)[0])) < _step:
+                        stats.add(dict(zip(header, map(float, line.strip().split(",")))))
+    return stats
+
+
+def open_thermo(path, columns, data):
+    """Opens buffered thermo sink, rows of steps after restart point are dropped"""
+    return ThermoSink(
+        path,
+        columns,
+        _step,
+        data.get("thermo_flush_rows", 100),
+        data.get("thermo_flush_seconds", 30),
+        data.get("thermo_format"),
+        data.get("thermo_columnar_path"),
     )
+
+
+def open_trajectory(data):
+    """Opens trajectory writer selected by config"""
+    backend = data.get("trajectory_backend", "lammps")
+    path = data["trajectory_template"] if backend == "lammps" else data["trajectory_path"]
+    writer = trajectory.open_writer(backend, path, _types, start=_step, **data.get("trajectory_options", {}))
     
-    return data_collection
+    # full frames every few outputs, atoms around bubble otherwise
+    if data.get("dump_region") is not None:
+        writer = RegionWriter(writer, _types, data["average_steps"] + data["skip_steps"], **data["dump_region"])
+    return writer
+
+
+def export_trajectory(**data):
+    """Exports binary trajectory to LAMMPS dumps"""
+    trajectory.export_lammps(data["trajectory_path"], data["trajectory_template"], data.get("frames"))
     
     
-def load_analyzing_script(path, function):
-    # load module
-    spec = iu.spec_from_file_location(
-        "analysis", path
+def open_checkpoints(data):
+    return checkpoint.CheckpointManager(
+        data["checkpoint_template"],
+        data.get("checkpoint_index"),
+        data.get("checkpoint_compression"),
+        data.get("checkpoint_keep_last"),
+        data.get("checkpoint_keep_every"),
+        _config_hash,
     )
-    module = iu.module_from_spec(spec)
-    spec.loader.exec_module(module)
+
+
+def report_rates(profiler, windows, iter_steps, elapsed, written):
+    """Adds ns/day, steps/s and trajectory MB/s of a simulate loop to profile summary"""
+    steps = windows * iter_steps
+    ns = steps * _simulation.integrator.getStepSize().value_in_unit(un.nanosecond)
+    profiler.metric("steps/s", steps / elapsed)
+    profiler.metric("ns/day", ns / elapsed * 86400)
+    profiler.metric("trajectory written", written / elapsed / 1e6, "MB/s")
+
+
+def add_times(profiler, simulations):
+    for simulation in simulations:
+        for name, seconds in simulation.pop_times().items():
+            profiler.add(name, seconds)
+
+
+def simulate_ensemble(profiler, **data):
+    """Steps replicas concurrently, writes per replica outputs and ensemble averaged thermo"""
+    if data.get("analyzing_script") is not None or data.get("async_dump", False):
+        raise ValueError("Ensembles support neither analyzing_script nor async_dump")
+    check_replica_paths(data)
     
-    # get entry points
-    return getattr(module, function)
+    # next multiple of checkpoint_steps to save, counted from restored step
+    saved_checkpoints = _step // data["checkpoint_steps"] + 1 if data["checkpoint_steps"] > 0 else 0
+    iter_steps = data["average_steps"] + data["skip_steps"]
     
+    replicas = [replica_data(data, r) for r in range(len(_replicas))]
+    writers = [open_trajectory(replica) for replica in replicas]
+    checkpoints = [open_checkpoints(replica) for replica in replicas]
+    analyses = [open_bubble(simulation, data) for simulation in _replicas]
+    columns = _simulation.thermo_columns() + (list(bubble.COLUMNS) if data.get("bubble") is not None else [])
+    stats = [open_statistics(columns, iter_steps, replica["thermo"], data) for replica in replicas]
+    stats_columns = stats[0].columns() if stats[0] is not None else []
+    thermos = [open_thermo(replica["thermo"], columns + stats_columns, replica) for replica in replicas]
+    ensemble_thermo = open_thermo(data["ensemble_thermo"], columns + [f"{column}_std" for column in columns[1:]], {
+        **data,
+        "thermo_columnar_path": data.get("ensemble_thermo_columnar_path"),
+    })
+    
+    def advance(simulation):
+        result = simulation.mean_next(data["average_steps"])
+        # skip dumps
+        if data["skip_steps"] > 0:
+            simulation.step(data["skip_steps"])
+        return result
+    
+    windows = range(_step, data["run_steps"] + _step, iter_steps)
+    written = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(_replicas)) as pool:
+        for i in tqdm(windows):
+            rows = []
+            with profiler.span("mean_next", "openmm", replicas=len(_replicas)):
+                results = list(pool.map(advance, _replicas))
+            add_times(profiler, _replicas)
+            
+            with profiler.span("dump", "openmm"):
+                for r, result in enumerate(results):
+                    u, t, P, T, p, v, s = result
+                    stress = _replicas[r].stress if "pxx" in columns else None
+                    extra = analyses[r](p, t) if analyses[r] is not None else None
+                    rows.append([u, t, P, T] + ([] if stress is None else list(stress)) + (extra or []))
+                    if stats[r] is not None:
+                        extra = (extra or []) + stats[r].add(dict(zip(columns[1:], rows[-1])), p)
+                    written += dump(thermos[r], writers[r], p, v, u, t, P, T, i, s.getPeriodicBoxVectors(asNumpy=True).value_in_unit(un.angstrom), stress, extra, **replicas[r])
+            
+            # ensemble average
+            rows = np.asarray(rows)
+            ensemble_thermo.write([i, *rows.mean(axis=0), *rows.std(axis=0)])
+            
+            # save checkpoint
+            if data["checkpoint_steps"] > 0 and (i + iter_steps) // data["checkpoint_steps"] >= saved_checkpoints:
+                with profiler.span("checkpoint", "openmm"):
+                    ensemble_thermo.flush()
+                    for simulation, writer, manager, therm in zip(_replicas, writers, checkpoints, thermos):
+                        writer.flush()
+                        therm.flush()
+                        manager.save(simulation.context, i + iter_steps)
+                saved_checkpoints = (i + iter_steps) // data["checkpoint_steps"] + 1
+            
+            # standard error targets reached by all replicas
+            if stats[0] is not None and all(replica.converged() for replica in stats):
+                print(f"Standard error targets reached at step {i + iter_steps}")
+                break
+    windows = (i + iter_steps - _step) // iter_steps
+    report_rates(profiler, windows * len(_replicas), iter_steps, time.perf_counter() - start, written)
+    
+    for simulation, writer, manager, therm in zip(_replicas, writers, checkpoints, thermos):
+        writer.close()
+        therm.close()
+        manager.save(simulation.context, i + iter_steps)
+        manager.close()
+    ensemble_thermo.close()
+
+
+def simulate(state, **data):
+    # kernel profiler, does nothing unless profiling is enabled
+    profiler = state.shared("profiler")
+    
+    if _replicas is not None:
+        return simulate_ensemble(profiler, **data)
     
-def simulate(**data):
     # helping variables
-    saved_checkpoints = 0
+    # next multiple of checkpoint_steps to save, counted from restored step
+    saved_checkpoints = _step // data["checkpoint_steps"] + 1 if data["checkpoint_steps"] > 0 else 0
     iter_steps = data["average_steps"] + data["skip_steps"]
+    checkpoints = open_checkpoints(data)
     
-    if not data["analyzing_script"] is None:
+    # stream frames to analysis function or run analyzing script on dumps
+    stream = None
+    if not data["analyzing_script"] is None and data.get("analyzing_function") is not None:
+        stream = analysis.open_stream(
+            data["analyzing_script"],
+            data["analyzing_function"],
+            _types,
+            _simulation.get_state().getPeriodicBoxVectors(asNumpy=True).value_in_unit(un.angstrom),
+            data.get("analyzing_mode", "thread"),
+            data.get("analyzing_buffers", 2),
+        )
+    elif not data["analyzing_script"] is None:
         log = open(data["logfile"], "w")
         analize = subprocess.Popen(f"python {data['analyzing_script']}", shell=True, stdout=log, stderr=log)
     
-    with open(data["thermo"], "a") as f:
-        if _step == 0:
-            f.write("step,u,t,P,T\n")
-        for i in tqdm(range(_step, data["run_steps"] + _step, iter_steps)):
+    writer = open_trajectory(data)
+    
+    analysis_bubble = open_bubble(_simulation, data)
+    columns = _simulation.thermo_columns() + (list(bubble.COLUMNS) if analysis_bubble is not None else [])
+    stats = open_statistics(columns, iter_steps, data["thermo"], data)
+    if stats is not None:
+        columns += stats.columns()
+    # bytes written by trajectory writer, counted on the thread which writes
+    written = 0
+    
+    def write(*args, **kwargs):
+        nonlocal written
+        with profiler.span("dump_write", "openmm"):
+            written += dump(*args, **kwargs)
+    
+    with open_thermo(data["thermo"], columns, data) as f:
+        # write frame N on writer thread while frame N + 1 is integrated
+        if data.get("async_dump", False):
+            pipeline = DumpPipeline(write, data.get("dump_buffers", 2))
+            submit = pipeline.submit
+        else:
+            pipeline = None
+            submit = write
+        
+        windows = range(_step, data["run_steps"] + _step, iter_steps)
+        start = time.perf_counter()
+        progress = tqdm(windows)
+        for i in progress:
             # get data
-            result = _simulation.mean_next(data["average_steps"])
+            with profiler.span("mean_next", "openmm", step=i):
+                result = _simulation.mean_next(data["average_steps"])
             
             # split result
             u, t, P, T, p, v, s = result
+            stress = _simulation.stress if "pxx" in columns else None
+            
+            # bubble observables
+            extra = None
+            if analysis_bubble is not None:
+                with profiler.span("bubble", "openmm"):
+                    extra = analysis_bubble(p, t)
+            
+            # mean, standard error and autocorrelation time so far
+            if stats is not None:
+                with profiler.span("statistics", "openmm"):
+                    row = [u, t, P, T] + ([] if stress is None else list(stress)) + (extra or [])
+                    extra = (extra or []) + stats.add(dict(zip(columns[1:], row)), p)
             
             # dump
-            dump(f, p, v, u, t, P, T, i, s.getPeriodicBoxVectors(asNumpy=True).value_in_unit(un.angstrom), **data)
+            # with async dump only queueing is timed here, the write in dump_write
+            with profiler.span("dump" if pipeline is None else "dump_submit", "openmm"):
+                submit(f, writer, p, v, u, t, P, T, i, s.getPeriodicBoxVectors(asNumpy=True).value_in_unit(un.angstrom), stress, extra, **data)
+            if pipeline is not None and pipeline.stalls > 0:
+                progress.set_postfix(io_stalls=pipeline.stalls, io_wait=f"{pipeline.stall_time:.1f}s")
+            
+            # analysis
+            if stream is not None:
+                row = [i, u, t, P, T] + ([] if stress is None else list(stress)) + (extra or [])
+                with profiler.span("analysis", "openmm"):
+                    stream.send(i, p, v, dict(zip(columns, row)))
             
             # skip dumps
             if data["skip_steps"] > 0:
-                _simulation.step(data["skip_steps"])
+                with profiler.span("skip_steps", "openmm"):
+                    _simulation.step(data["skip_steps"])
+            add_times(profiler, [_simulation])
             
             # save checkpoint
             if data["checkpoint_steps"] > 0 and (i + iter_steps) // data["checkpoint_steps"] >= saved_checkpoints:
-                with open(data["checkpoint_template"].format(i=i+iter_steps), "wb") as ff:
-                    ff.write(_simulation.context.createCheckpoint())
-                saved_checkpoints += 1
+                with profiler.span("checkpoint", "openmm"):
+                    if pipeline is not None:
+                        pipeline.join()
+                    writer.flush()
+                    f.flush()
+                    checkpoints.save(_simulation.context, i + iter_steps)
+                saved_checkpoints = (i + iter_steps) // data["checkpoint_steps"] + 1
+            
+            # stop once standard error targets are reached
+            if stats is not None and stats.converged():
+                print(f"Standard error targets reached at step {i + iter_steps}")
+                break
 
-    with open(data["checkpoint_template"].format(i=i+iter_steps), "wb") as f:
-        f.write(_simulation.context.createCheckpoint())
+        if pipeline is not None:
+            pipeline.close()
+            if pipeline.stalls > 0:
+                profiler.add("dump_stall", pipeline.stall_time, pipeline.stalls)
+                print(f"Dump writer stalled integration {pipeline.stalls} times for {pipeline.stall_time:.1f} s")
+        report_rates(profiler, (i + iter_steps - _step) // iter_steps, iter_steps, time.perf_counter() - start, written)
+    
+    writer.close()
+    
+    checkpoints.save(_simulation.context, i + iter_steps)
+    checkpoints.close()
         
-    if not data["analyzing_script"] is None:
-        with open(data["trajectory_template"].format(i=i+iter_steps), "w") as f:
+    if stream is not None:
+        # end of stream
+        stream.close()
+    elif not data["analyzing_script"] is None:
+        # empty dump at the end, beside binary trajectory which must not be overwritten
+        backend = data.get("trajectory_backend", "lammps")
+        end = data["trajectory_template"].format(i=i+iter_steps) if backend == "lammps" else data["trajectory_path"] + ".end"
+        with open(end, "w") as f:
             f.write("")
 
         analize.wait()
@@ -0,0 +1,57 @@
+import queue
+import threading
+import time
+
+
+class DumpPipeline:
+    """Runs dumps on a writer thread, at most buffers frames wait in the queue"""
+
+    def __init__(self, function, buffers=2):
+        self.function = function
+        self.queue = queue.Queue(maxsize=buffers)
+        self.error = None
+        # back-pressure statistics
+        self.stalls = 0
+        self.stall_time = 0.0
+
+        self.thread = threading.Thread(target=self.run, name="dump-writer", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if self.error is None:
+                    self.function(*item[0], **item[1])
+            except BaseException as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def check(self):
+        if self.error is not None:
+            raise RuntimeError("Dump writer failed") from self.error
+
+    def submit(self, *args, **kwargs):
+        """Queues a dump, blocks while all buffers are full"""
+        self.check()
+        try:
+            self.queue.put_nowait((args, kwargs))
+        except queue.Full:
+            # I/O is slower than integration
+            start = time.perf_counter()
+            self.queue.put((args, kwargs))
+            self.stalls += 1
+            self.stall_time += time.perf_counter() - start
+
+    def join(self):
+        """Waits until all queued dumps are written"""
+        self.queue.join()
+        self.check()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.check()
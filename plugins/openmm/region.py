@@ -0,0 +1,48 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def region_mask(positions, types, cell, xe_type=2, shell=10.0):
+    """Mask of atoms closer than shell to any Xe atom, periodic orthogonal cell"""
+    cell = np.asarray(cell)
+    if np.count_nonzero(cell - np.diag(np.diag(cell))):
+        raise ValueError("Region dumps support orthogonal cells only")
+    box = np.diag(cell)
+
+    # periodic tree needs coordinates in [0, box)
+    positions = np.asarray(positions) % box
+    positions[positions >= box] = 0.0
+
+    xenon = positions[np.asarray(types) == xe_type]
+    if len(xenon) == 0:
+        return np.zeros(len(positions), dtype=bool)
+    distance = cKDTree(xenon, boxsize=box).query(positions, distance_upper_bound=shell)[0]
+    return np.isfinite(distance)
+
+
+class RegionWriter:
+    """Writes full frame every full_every outputs, otherwise atoms around Xe only
+
+    Outputs are counted from step 0, so restarts keep the same full frames.
+    """
+
+    def __init__(self, writer, types, iter_steps, full_every=10, xe_type=2, shell=10.0):
+        self.writer = writer
+        self.types = np.asarray(types)
+        self.iter_steps = iter_steps
+        self.full_every = full_every
+        self.xe_type = xe_type
+        self.shell = shell
+
+    def write(self, step, cell, positions, velocities):
+        if (step // self.iter_steps) % self.full_every == 0:
+            return self.writer.write(step, cell, positions, velocities)
+
+        ids = np.flatnonzero(region_mask(positions, self.types, cell, self.xe_type, self.shell))
+        return self.writer.write_region(step, cell, ids, positions[ids], velocities[ids])
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
@@ -0,0 +1,170 @@
+import os
+import glob
+import time
+
+import numpy as np
+
+# columnar chunk formats, pandas is needed for parquet and feather
+FORMATS = (None, "npz", "parquet", "feather")
+
+
+def chunk_range(filename):
+    """First and last step of chunk file name"""
+    first, last = os.path.basename(filename).split(".")[0].split("-")
+    return int(first), int(last)
+
+
+def chunks(path):
+    return sorted(glob.glob(os.path.join(path, "*-*.*")), key=chunk_range)
+
+
+def read_chunk(filename):
+    if filename.endswith(".npz"):
+        with np.load(filename) as data:
+            return {name: data[name] for name in data.files}
+
+    import pandas as pd
+
+    table = pd.read_parquet(filename) if filename.endswith(".parquet") else pd.read_feather(filename)
+    return {name: table[name].to_numpy() for name in table.columns}
+
+
+def write_chunk(filename, columns):
+    tmp = f"{filename}.tmp"
+    if filename.endswith(".npz"):
+        with open(tmp, "wb") as f:
+            np.savez(f, **columns)
+    else:
+        import pandas as pd
+
+        table = pd.DataFrame(columns)
+        if filename.endswith(".parquet"):
+            table.to_parquet(tmp)
+        else:
+            table.to_feather(tmp)
+    os.replace(tmp, filename)
+
+
+def read(path, start=None, stop=None):
+    """Columns of thermo chunks with start <= step < stop, only overlapping chunks are read"""
+    parts = []
+    for filename in chunks(path):
+        first, last = chunk_range(filename)
+        if start is not None and last < start or stop is not None and first >= stop:
+            continue
+        columns = read_chunk(filename)
+        mask = np.ones(len(columns["step"]), dtype=bool)
+        if start is not None:
+            mask &= columns["step"] >= start
+        if stop is not None:
+            mask &= columns["step"] < stop
+        parts.append({name: values[mask] for name, values in columns.items()})
+
+    if not parts:
+        return {}
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+class ThermoSink:
+    """Buffers thermo rows and writes them to CSV and optional columnar chunks
+
+    Rows are flushed when flush_rows are buffered, flush_seconds passed since the last
+    flush, at checkpoints and on close. Rows of steps from start on, written by a run
+    which went beyond its last checkpoint, are removed when the sink is opened.
+    Outputs written with other columns are moved aside to <path>.<n> instead.
+    Columnar chunks are files named by their first and last step in columnar_path.
+    """
+
+    def __init__(self, path, columns, start=0, flush_rows=100, flush_seconds=30, columnar=None, columnar_path=None):
+        if columnar not in FORMATS:
+            raise ValueError(f"Unknown thermo format \"{columnar}\"")
+
+        self.path = path
+        self.columns = columns
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.columnar = columnar
+        self.columnar_path = columnar_path or f"{path}.{columnar}.d"
+        self.rows = []
+        self.last_flush = time.monotonic()
+
+        self.rotate()
+        self.truncate(start)
+        if columnar is not None:
+            os.makedirs(self.columnar_path, exist_ok=True)
+            self.truncate_columnar(start)
+        self.file = open(path, "a")
+
+    def rotate(self):
+        """Moves thermo file and chunks with other columns to first free <path>.<n>"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            header = f.readline().strip()
+        if not header or header == ",".join(self.columns):
+            return
+
+        n = 1
+        while os.path.exists(f"{self.path}.{n}") or os.path.exists(f"{self.columnar_path}.{n}"):
+            n += 1
+        print(f"Thermo columns changed, moving \"{self.path}\" to \"{self.path}.{n}\"")
+        os.replace(self.path, f"{self.path}.{n}")
+        if os.path.isdir(self.columnar_path):
+            os.replace(self.columnar_path, f"{self.columnar_path}.{n}")
+
+    def truncate(self, start):
+        """Keeps header and rows before start, writes header to new file"""
+        lines = []
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                lines = f.readlines()
+        kept = [",".join(self.columns) + "\n"]
+        kept += [line for line in lines[1:] if line.strip() and int(float(line.split(",", 1)[0])) < start]
+        if kept != lines:
+            with open(self.path, "w") as f:
+                f.writelines(kept)
+
+    def truncate_columnar(self, start):
+        for filename in chunks(self.columnar_path):
+            first, last = chunk_range(filename)
+            if first >= start:
+                os.remove(filename)
+            elif last >= start:
+                columns = read_chunk(filename)
+                mask = columns["step"] < start
+                os.remove(filename)
+                write_chunk(
+                    os.path.join(self.columnar_path, f"{first}-{columns['step'][mask][-1]}.{self.columnar}"),
+                    {name: values[mask] for name, values in columns.items()},
+                )
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.rows:
+            return
+
+        self.file.write("".join(",".join(str(value) for value in row) + "\n" for row in self.rows))
+        self.file.flush()
+
+        if self.columnar is not None:
+            table = np.asarray(self.rows, dtype=float)
+            columns = {name: table[:, j] for j, name in enumerate(self.columns)}
+            columns["step"] = table[:, 0].astype(np.int64)
+            first, last = columns["step"][0], columns["step"][-1]
+            write_chunk(os.path.join(self.columnar_path, f"{first}-{last}.{self.columnar}"), columns)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
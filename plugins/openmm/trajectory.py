@@ -0,0 +1,345 @@
+import os
+
+import numpy as np
+
+from ovito import data as odata
+from ovito import io as oio
+
+
+LAMMPS_COLUMNS = [
+    "Particle Identifier",
+    "Particle Type",
+    "Position.X",
+    "Position.Y",
+    "Position.Z",
+    "Velocity.X",
+    "Velocity.Y",
+    "Velocity.Z",
+]
+
+
+def write_lammps_dump(filename, cell, positions, velocities, types, ids=None):
+    """Writes one frame as LAMMPS text dump, ids are zero based particle indices of a partial frame"""
+    data_collection = odata.DataCollection()
+
+    # set cell
+    data_cell = odata.SimulationCell(pbc=(True, True, True))
+    data_cell[:, :3] = cell
+    data_collection.objects.append(data_cell)
+
+    # set positions, velocities and types
+    particles = odata.Particles()
+    particles.create_property("Position", data=positions)
+    particles.create_property("Velocity", data=velocities)
+    particles.create_property("Particle Type", data=types)
+    particles.create_property("Particle Identifier", data=(np.arange(len(positions)) if ids is None else ids) + 1)
+    data_collection.objects.append(particles)
+
+    # export
+    if os.path.dirname(filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+    oio.export_file(data_collection, filename, "lammps/dump", columns=LAMMPS_COLUMNS)
+
+    return data_collection
+
+
+class LammpsWriter:
+    """One LAMMPS text dump per frame, writes return size of the dump file"""
+
+    def __init__(self, template, types, **options):
+        self.template = template
+        self.types = types
+
+    def write(self, step, cell, positions, velocities):
+        write_lammps_dump(self.template.format(i=step), cell, positions, velocities, self.types)
+        return os.path.getsize(self.template.format(i=step))
+
+    def write_region(self, step, cell, ids, positions, velocities):
+        write_lammps_dump(self.template.format(i=step), cell, positions, velocities, self.types[ids], ids)
+        return os.path.getsize(self.template.format(i=step))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Hdf5Writer:
+    """Appends frames to one chunked compressed HDF5 file
+
+    Writes return bytes of the stored arrays before compression.
+    """
+
+    def __init__(self, path, types, start=0, dtype="float32", compression="gzip", **options):
+        import h5py
+
+        self.file = h5py.File(path, "a")
+        self.dtype = np.dtype(dtype)
+        count = len(types)
+
+        if "step" not in self.file:
+            # written once
+            self.file.create_dataset("types", data=types)
+            self.file.create_dataset("step", shape=(0,), maxshape=(None,), dtype="int64", chunks=(1024,))
+            for name in ("positions", "velocities"):
+                self.file.create_dataset(
+                    name,
+                    shape=(0, count, 3),
+                    maxshape=(None, count, 3),
+                    dtype=self.dtype,
+                    chunks=(1, count, 3),
+                    compression=compression,
+                    shuffle=compression is not None,
+                )
+
+        if "region_step" not in self.file:
+            # partial frames, atoms of frame i are offset[i]:offset[i] + count[i]
+            for name in ("region_step", "region_offset", "region_count"):
+                self.file.create_dataset(name, shape=(0,), maxshape=(None,), dtype="int64", chunks=(1024,))
+            self.file.create_dataset("region_ids", shape=(0,), maxshape=(None,), dtype="int64", chunks=(65536,), compression=compression)
+            for name in ("region_positions", "region_velocities"):
+                self.file.create_dataset(
+                    name,
+                    shape=(0, 3),
+                    maxshape=(None, 3),
+                    dtype=self.dtype,
+                    chunks=(65536, 3),
+                    compression=compression,
+                    shuffle=compression is not None,
+                )
+
+        # drop frames written after the restart point
+        self.resize(int(np.searchsorted(self.file["step"][...], start)))
+        frames = int(np.searchsorted(self.file["region_step"][...], start))
+        self.resize_region(frames, int(self.file["region_offset"][frames - 1] + self.file["region_count"][frames - 1]) if frames else 0)
+
+    def resize(self, frames):
+        for name in ("step", "positions", "velocities"):
+            self.file[name].resize(frames, axis=0)
+
+    def resize_region(self, frames, atoms):
+        for name in ("region_step", "region_offset", "region_count"):
+            self.file[name].resize(frames, axis=0)
+        for name in ("region_ids", "region_positions", "region_velocities"):
+            self.file[name].resize(atoms, axis=0)
+
+    def write_region(self, step, cell, ids, positions, velocities):
+        if "cell" not in self.file:
+            self.file.create_dataset("cell", data=np.asarray(cell, dtype="float64"))
+
+        frame = len(self.file["region_step"])
+        offset = len(self.file["region_ids"])
+        self.resize_region(frame + 1, offset + len(ids))
+        self.file["region_ids"][offset:] = ids
+        self.file["region_positions"][offset:] = positions
+        self.file["region_velocities"][offset:] = velocities
+        self.file["region_offset"][frame] = offset
+        self.file["region_count"][frame] = len(ids)
+        self.file["region_step"][frame] = step
+        return len(ids) * (8 + 6 * self.dtype.itemsize) + 24
+
+    def write(self, step, cell, positions, velocities):
+        if "cell" not in self.file:
+            self.file.create_dataset("cell", data=np.asarray(cell, dtype="float64"))
+
+        frame = len(self.file["step"])
+        self.resize(frame + 1)
+        self.file["step"][frame] = step
+        self.file["positions"][frame] = positions
+        self.file["velocities"][frame] = velocities
+        return 2 * positions.size * self.dtype.itemsize + 8
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class NpyWriter:
+    """Appends raw frames to memory mappable files in a directory, step file is the index
+
+    Writes return bytes appended to the files.
+    """
+
+    def __init__(self, path, types, start=0, dtype="float32", **options):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dtype = np.dtype(dtype)
+
+        if not os.path.exists(os.path.join(path, "types.npy")):
+            # written once
+            np.save(os.path.join(path, "types.npy"), types)
+            np.save(os.path.join(path, "dtype.npy"), np.asarray(self.dtype.str))
+        self.frame_size = len(types) * 3 * self.dtype.itemsize
+
+        # drop frames written after the restart point
+        steps = np.fromfile(os.path.join(path, "step.bin"), dtype="int64") if os.path.exists(os.path.join(path, "step.bin")) else np.zeros(0, dtype="int64")
+        frames = int(np.searchsorted(steps, start))
+
+        self.files = {}
+        for name, size in (("step", 8), ("positions", self.frame_size), ("velocities", self.frame_size)):
+            self.files[name] = open(os.path.join(path, f"{name}.bin"), "ab")
+            self.files[name].truncate(frames * size)
+
+        # partial frames, index rows are (step, offset, count) in atoms
+        index = np.fromfile(os.path.join(path, "region_index.bin"), dtype="int64").reshape(-1, 3) if os.path.exists(os.path.join(path, "region_index.bin")) else np.zeros((0, 3), dtype="int64")
+        frames = int(np.searchsorted(index[:, 0], start))
+        self.region_atoms = int(index[frames - 1, 1] + index[frames - 1, 2]) if frames else 0
+        for name, size in (("region_index", 24), ("region_ids", 8), ("region_positions", 3 * self.dtype.itemsize), ("region_velocities", 3 * self.dtype.itemsize)):
+            self.files[name] = open(os.path.join(path, f"{name}.bin"), "ab")
+            self.files[name].truncate((frames if name == "region_index" else self.region_atoms) * size)
+
+    def write(self, step, cell, positions, velocities):
+        if not os.path.exists(os.path.join(self.path, "cell.npy")):
+            np.save(os.path.join(self.path, "cell.npy"), np.asarray(cell, dtype="float64"))
+
+        # index is written last so that a frame in step.bin is always complete
+        np.ascontiguousarray(positions, dtype=self.dtype).tofile(self.files["positions"])
+        np.ascontiguousarray(velocities, dtype=self.dtype).tofile(self.files["velocities"])
+        self.files["positions"].flush()
+        self.files["velocities"].flush()
+        np.asarray([step], dtype="int64").tofile(self.files["step"])
+        return 2 * self.frame_size + 8
+
+    def write_region(self, step, cell, ids, positions, velocities):
+        if not os.path.exists(os.path.join(self.path, "cell.npy")):
+            np.save(os.path.join(self.path, "cell.npy"), np.asarray(cell, dtype="float64"))
+
+        np.asarray(ids, dtype="int64").tofile(self.files["region_ids"])
+        np.ascontiguousarray(positions, dtype=self.dtype).tofile(self.files["region_positions"])
+        np.ascontiguousarray(velocities, dtype=self.dtype).tofile(self.files["region_velocities"])
+        for name in ("region_ids", "region_positions", "region_velocities"):
+            self.files[name].flush()
+        np.asarray([step, self.region_atoms, len(ids)], dtype="int64").tofile(self.files["region_index"])
+        self.region_atoms += len(ids)
+        return len(ids) * (8 + 6 * self.dtype.itemsize) + 24
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+BACKENDS = {
+    "lammps": LammpsWriter,
+    "hdf5": Hdf5Writer,
+    "npy": NpyWriter,
+}
+
+
+def open_writer(backend, path, types, **options):
+    """Creates trajectory writer of selected backend"""
+    try:
+        writer_class = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown trajectory backend \"{backend}\"")
+    return writer_class(path, types, **options)
+
+
+class TrajectoryReader:
+    """Random access to frames written by Hdf5Writer or NpyWriter
+
+    cell is None while no frame was written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        if os.path.isdir(path):
+            self.file = None
+            self.types = np.load(os.path.join(path, "types.npy"))
+            self.cell = np.load(os.path.join(path, "cell.npy")) if os.path.exists(os.path.join(path, "cell.npy")) else None
+            self.steps = np.fromfile(os.path.join(path, "step.bin"), dtype="int64")
+            dtype = np.dtype(str(np.load(os.path.join(path, "dtype.npy"))))
+            shape = (len(self.steps), len(self.types), 3)
+            if len(self.steps) == 0:
+                # empty files cannot be mapped
+                self.positions = self.velocities = np.zeros(shape, dtype=dtype)
+            else:
+                self.positions = np.memmap(os.path.join(path, "positions.bin"), dtype=dtype, mode="r", shape=shape)
+                self.velocities = np.memmap(os.path.join(path, "velocities.bin"), dtype=dtype, mode="r", shape=shape)
+
+            index = os.path.join(path, "region_index.bin")
+            index = np.fromfile(index, dtype="int64").reshape(-1, 3) if os.path.exists(index) else np.zeros((0, 3), dtype="int64")
+            self.region_steps, self.region_offsets, self.region_counts = index.T
+            self.region_ids = np.fromfile(os.path.join(path, "region_ids.bin"), dtype="int64") if len(index) else np.zeros(0, dtype="int64")
+            self.region_positions = np.fromfile(os.path.join(path, "region_positions.bin"), dtype=dtype).reshape(-1, 3) if len(index) else np.zeros((0, 3), dtype=dtype)
+            self.region_velocities = np.fromfile(os.path.join(path, "region_velocities.bin"), dtype=dtype).reshape(-1, 3) if len(index) else np.zeros((0, 3), dtype=dtype)
+        else:
+            import h5py
+
+            self.file = h5py.File(path, "r")
+            self.types = self.file["types"][...]
+            self.cell = self.file["cell"][...] if "cell" in self.file else None
+            self.steps = self.file["step"][...]
+            self.positions = self.file["positions"]
+            self.velocities = self.file["velocities"]
+            if "region_step" in self.file:
+                self.region_steps = self.file["region_step"][...]
+                self.region_offsets = self.file["region_offset"][...]
+                self.region_counts = self.file["region_count"][...]
+                self.region_ids = self.file["region_ids"]
+                self.region_positions = self.file["region_positions"]
+                self.region_velocities = self.file["region_velocities"]
+            else:
+                # written before partial frames existed
+                self.region_steps = self.region_offsets = self.region_counts = self.region_ids = np.zeros(0, dtype="int64")
+                self.region_positions = self.region_velocities = np.zeros((0, 3))
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __getitem__(self, frame):
+        """Returns step, positions and velocities of frame"""
+        return self.steps[frame], np.asarray(self.positions[frame]), np.asarray(self.velocities[frame])
+
+    def find(self, step):
+        """Frame index of step"""
+        frame = int(np.searchsorted(self.steps, step))
+        if frame == len(self.steps) or self.steps[frame] != step:
+            raise KeyError(f"No frame for step {step}")
+        return frame
+
+    def region(self, step):
+        """Particle ids, positions and velocities of partial frame of step"""
+        frame = int(np.searchsorted(self.region_steps, step))
+        if frame == len(self.region_steps) or self.region_steps[frame] != step:
+            raise KeyError(f"No partial frame for step {step}")
+        atoms = slice(int(self.region_offsets[frame]), int(self.region_offsets[frame] + self.region_counts[frame]))
+        return np.asarray(self.region_ids[atoms]), np.asarray(self.region_positions[atoms]), np.asarray(self.region_velocities[atoms])
+
+    def reconstruct(self, step):
+        """Full frame of step, atoms outside of a partial frame are taken from the last full frame before it"""
+        if step in self.steps:
+            return self[self.find(step)][1:]
+
+        frame = int(np.searchsorted(self.steps, step)) - 1
+        if frame < 0:
+            raise KeyError(f"No full frame before step {step}")
+        _, positions, velocities = self[frame]
+        positions = positions.copy()
+        velocities = velocities.copy()
+        ids, region_positions, region_velocities = self.region(step)
+        positions[ids] = region_positions
+        velocities[ids] = region_velocities
+        return positions, velocities
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def export_lammps(path, template, frames=None):
+    """Exports binary trajectory frames to LAMMPS text dumps"""
+    reader = TrajectoryReader(path)
+    try:
+        for frame in range(len(reader)) if frames is None else frames:
+            step, positions, velocities = reader[frame]
+            write_lammps_dump(template.format(i=step), reader.cell, positions, velocities, reader.types)
+    finally:
+        reader.close()
@@ -0,0 +1,170 @@
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import urllib.parse
+import urllib.request
+import tempfile
+import hashlib
+import shutil
+import fcntl
+import json
+import os
+
+from common import file_sha256
+
+# Linux FICLONE ioctl, copy-on-write clone of a file
+FICLONE = 0x40049409
+
+
+def reflink(src: Path, dst: Path):
+    with open(src, "rb") as read, open(dst, "wb") as write:
+        fcntl.ioctl(write.fileno(), FICLONE, read.fileno())
+
+
+def temporary(dst: Path) -> Path:
+    """Path named as dst in a new private directory beside it"""
+    return Path(tempfile.mkdtemp(dir=dst.parent, prefix=f".{dst.name}.")).joinpath(dst.name)
+
+
+def place(src: Path, dst: Path, link: str):
+    """Places src at dst as hard link, reflink or copy, falls back to copy
+
+    A hard link shares inode and mode of the read-only cache object, so it is only
+    made when asked for.
+    """
+    tmp = temporary(dst)
+    try:
+        try:
+            if link == "hardlink":
+                os.link(src, tmp)
+            elif link == "reflink":
+                reflink(src, tmp)
+            else:
+                shutil.copyfile(src, tmp)
+        except OSError:
+            # different filesystem or no reflink support
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        shutil.rmtree(tmp.parent, ignore_errors=True)
+
+
+class Cache:
+    """Content-addressed store, objects are named by sha256 and URLs map to objects"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.objects = self.path.joinpath("objects")
+        self.urls = self.path.joinpath("urls")
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.urls.mkdir(parents=True, exist_ok=True)
+
+    def url_entry(self, url: str) -> Path:
+        return self.urls.joinpath(hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+    def lookup(self, url: str, sha256: str = None):
+        """Cached object of url or checksum, None if not cached"""
+        if sha256 is None:
+            try:
+                sha256 = json.loads(self.url_entry(url).read_text())["sha256"]
+            except FileNotFoundError:
+                return None
+        obj = self.objects.joinpath(sha256)
+        return obj if obj.exists() else None
+
+    def download(self, url: str, sha256: str = None) -> Path:
+        """Downloads url into cache, verifies checksum if given"""
+        digest = hashlib.sha256()
+        with urllib.request.urlopen(url) as response, tempfile.NamedTemporaryFile(dir=self.objects, delete=False) as tmp:
+            for chunk in iter(lambda: response.read(1 << 20), b""):
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        if sha256 is not None and digest.hexdigest() != sha256:
+            os.remove(tmp.name)
+            raise ValueError(f"Checksum mismatch for \"{url}\"")
+
+        obj = self.objects.joinpath(digest.hexdigest())
+        # objects are shared by links, protect them from writes
+        os.chmod(tmp.name, 0o444)
+        os.replace(tmp.name, obj)
+        self.url_entry(url).write_text(json.dumps({"url": url, "sha256": digest.hexdigest()}))
+        return obj
+
+
+def up_to_date(obj: Path, dst: Path) -> bool:
+    if not dst.exists():
+        return False
+    if os.path.samefile(obj, dst):
+        return True
+    return dst.stat().st_size == obj.stat().st_size and file_sha256(dst) == obj.name
+
+
+def install_one(src: str, dst: Path, sha256: str, cache: Cache, link: str, refresh: bool) -> str:
+    """Installs one pair, returns what was done"""
+    # local file
+    if src.startswith("/"):
+        src = Path(src)
+        if dst.exists() and dst.stat().st_size == src.stat().st_size and dst.stat().st_mtime_ns == src.stat().st_mtime_ns:
+            return "skipped"
+        shutil.copy2(src, dst)
+        return "copied"
+
+    # download without cache
+    if cache is None:
+        tmp = temporary(dst)
+        try:
+            urllib.request.urlretrieve(src, tmp)
+            if sha256 is not None and file_sha256(tmp) != sha256:
+                raise ValueError(f"Checksum mismatch for \"{src}\"")
+            os.replace(tmp, dst)
+        finally:
+            shutil.rmtree(tmp.parent, ignore_errors=True)
+        return "downloaded"
+
+    obj = None if refresh else cache.lookup(src, sha256)
+    action = "cached"
+    if obj is None:
+        obj = cache.download(src, sha256)
+        action = "downloaded"
+
+    if up_to_date(obj, dst):
+        return "skipped"
+    place(obj, dst, link)
+    return action
+
+
+def parse_pair(pair):
+    """Source, destination and optional checksum of {src: dst} or {src: {path: dst, sha256: ...}}"""
+    src = list(pair.keys())[0]
+    dst = pair[src]
+    if isinstance(dst, dict):
+        return src, destination(src, Path(dst["path"])), dst.get("sha256")
+    return src, destination(src, Path(dst)), None
+
+
+def destination(src: str, dst: Path) -> Path:
+    """File in directory dst named after src, dst otherwise"""
+    if dst.is_dir():
+        return dst.joinpath(os.path.basename(urllib.parse.urlparse(src).path))
+    return dst
+
+
+def install(pairs, workers=4, cache=None, link="reflink", refresh=False):
+    """Installs pairs concurrently, returns {destination: action}"""
+    if link not in ("hardlink", "reflink", "copy"):
+        raise ValueError(f"Unknown link mode \"{link}\"")
+    cache = Cache(cache) if cache is not None else None
+
+    # concurrent installs to one destination would race
+    planned = {}
+    for pair in pairs:
+        src, dst, sha256 = parse_pair(pair)
+        if dst.resolve() in planned:
+            raise ValueError(f"Destination \"{dst}\" given more than once")
+        planned[dst.resolve()] = src, dst, sha256
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for src, dst, sha256 in planned.values():
+            futures[dst] = pool.submit(install_one, src, dst, sha256, cache, link, refresh)
+        return {str(dst): future.result() for dst, future in futures.items()}
@@ -0,0 +1,221 @@
+from pathlib import Path
+from typing import List
+import glob
+import json
+import stat
+import subprocess
+import os
+
+# permission bits of chmod who letters
+WHO = {
+    "u": stat.S_IRWXU | stat.S_ISUID,
+    "g": stat.S_IRWXG | stat.S_ISGID,
+    "o": stat.S_IRWXO | stat.S_ISVTX,
+}
+PERMISSIONS = {
+    "r": stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH,
+    "w": stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH,
+    "x": stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH,
+    "s": stat.S_ISUID | stat.S_ISGID,
+    "t": stat.S_ISVTX,
+}
+
+
+def read_umask():
+    """Process umask, read from /proc where possible since setting it affects all threads"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except OSError:
+        pass
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# read once on import, parse_mode runs concurrently with other entries
+UMASK = read_umask()
+
+
+def flatten(wd: Path, structure: List, entries: list):
+    """Lists (path, kind) of tree in creation order"""
+    # return if nothing to do
+    if structure is None:
+        return entries
+
+    for file in structure:
+        # directory
+        if isinstance(file, dict):
+            dirname = list(file.keys())[0]
+            current = wd.joinpath(dirname)
+            entries.append((str(current), "dir"))
+            flatten(current, file[dirname], entries)
+        # file
+        elif isinstance(file, str):
+            entries.append((str(wd.joinpath(file)), "file"))
+        # incorect object, throw exception
+        else:
+            raise ValueError(f"Incorect tree object: {file}")
+    return entries
+
+
+def read_manifest(path):
+    if path is None:
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_manifest(path, manifest):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def plan_tree(entries, manifest):
+    """Changes needed to get entries, given manifest of the previous run
+
+    Entries of the manifest are checked to exist, entries which do not are created again.
+    """
+    changes = []
+    desired = dict(entries)
+    for path, kind in entries:
+        if manifest.get(path) != kind or not os.path.lexists(path):
+            changes.append(("mkdir" if kind == "dir" else "touch", path))
+    for path in manifest:
+        if path not in desired:
+            # never removed, only reported
+            changes.append(("stale", path))
+    return changes
+
+
+def apply_tree(changes, exist_ok: bool):
+    for action, path in changes:
+        if action == "mkdir":
+            os.makedirs(path, exist_ok=exist_ok)
+        elif action == "touch":
+            # create without changing existing file
+            os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o666))
+
+
+def create(structure, exist_ok: bool, manifest=None, dry_run=False):
+    """Creates entries of structure missing from manifest or disk, returns changes"""
+    entries = flatten(Path("/"), structure, [])
+    changes = plan_tree(entries, read_manifest(manifest))
+
+    if not dry_run:
+        apply_tree(changes, exist_ok)
+        if manifest is not None:
+            write_manifest(manifest, dict(entries))
+    return changes
+
+
+def parse_mode(mode: str, current: int, is_dir: bool) -> int:
+    """New mode of file after octal or symbolic chmod mode, as GNU chmod
+
+    Directories keep set-user-ID and set-group-ID bits unless a mode sets or clears
+    them explicitly, with s or with an octal mode of more than four digits.
+    """
+    # directory bits kept by octal and = modes
+    kept = stat.S_IMODE(current) & (stat.S_ISUID | stat.S_ISGID) if is_dir else 0
+    if mode and all(c in "01234567" for c in mode):
+        return int(mode, 8) | (kept if len(mode) <= 4 else 0)
+
+    result = stat.S_IMODE(current)
+    umask = UMASK
+
+    for clause in mode.split(","):
+        who = ""
+        while clause and clause[0] in "ugoa":
+            who += clause[0]
+            clause = clause[1:]
+        mask = 0
+        for letter in who.replace("a", "ugo"):
+            mask |= WHO[letter]
+        if not clause:
+            raise ValueError(f"Invalid mode \"{mode}\"")
+
+        # sequence of operations, e.g. u+x-w
+        while clause:
+            op = clause[0]
+            if op not in "+-=":
+                raise ValueError(f"Invalid mode \"{mode}\"")
+            clause = clause[1:]
+            bits = 0
+            explicit = False
+            while clause and clause[0] not in "+-=":
+                letter = clause[0]
+                clause = clause[1:]
+                if letter in "ugo":
+                    # copy permissions of a class, e.g. g=u
+                    shift = {"u": 6, "g": 3, "o": 0}[letter]
+                    bits |= ((result >> shift) & 0o7) * 0o111
+                elif letter == "X":
+                    if is_dir or result & PERMISSIONS["x"]:
+                        bits |= PERMISSIONS["x"]
+                elif letter in PERMISSIONS:
+                    bits |= PERMISSIONS[letter]
+                    explicit |= letter == "s"
+                else:
+                    raise ValueError(f"Invalid mode \"{mode}\"")
+
+            # without who the umask applies, as in chmod
+            effective = mask if who else ~umask & 0o7777
+            if op == "+":
+                result |= bits & effective
+            elif op == "-":
+                result &= ~(bits & effective)
+            else:
+                cleared = mask if who else 0o7777
+                if not explicit:
+                    cleared &= ~kept
+                result = (result & ~cleared) | (bits & effective)
+    return result
+
+
+def expand(path: str, recursive: bool):
+    paths = glob.glob(path) if glob.has_magic(path) else [path]
+    for path in paths:
+        yield path
+        if recursive and os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                for name in dirs + files:
+                    yield os.path.join(root, name)
+
+
+def chmod(pairs, dry_run=False):
+    """Changes modes of {path: mode} pairs in process, returns changes"""
+    changes = []
+    for pair in pairs:
+        # get path and mod
+        path = list(pair.keys())[0]
+        mode = str(pair[path]).split()
+        recursive = "-R" in mode
+        mode = [m for m in mode if m != "-R"][0]
+
+        for current in expand(path, recursive):
+            st = os.stat(current)
+            try:
+                new = parse_mode(mode, st.st_mode, stat.S_ISDIR(st.st_mode))
+            except ValueError:
+                # modes not parsed here, e.g. -6000, are left to chmod
+                changes.append(("chmod", current, mode))
+                if not dry_run:
+                    subprocess.run(["chmod", "--", mode, current], check=True, capture_output=True)
+                continue
+            if new != stat.S_IMODE(st.st_mode):
+                changes.append(("chmod", current, oct(new)))
+                if not dry_run:
+                    os.chmod(current, new)
+    return changes
+
+
+def report(changes):
+    for change in changes:
+        print(" ".join(change))
@@ -0,0 +1,18 @@
+import hashlib
+
+
+# arrays of a handed off structure in LAMMPS metal units (angstrom, angstrom/ps, g/mol)
+STRUCTURE_KEYS = ("cell", "positions", "velocities", "masses", "types")
+
+
+def update_file(digest, path):
+    """Updates digest with file content, returns digest"""
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest
+
+
+def file_sha256(path):
+    """Hex sha256 of file content"""
+    return update_file(hashlib.sha256(), path).hexdigest()
@@ -0,0 +1,139 @@
+import os
+import json
+import hashlib
+import threading
+
+from common import file_sha256
+
+
+def walk_strings(value):
+    """Strings in nested lists and dictionaries"""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            yield from walk_strings(key)
+            yield from walk_strings(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from walk_strings(item)
+
+
+class Journal:
+    """Run journal of sequence entries
+
+    An entry is keyed by hash of its arguments, the files its arguments refer to and
+    the source of its plugin. Files named in arguments which the entry created itself
+    are outputs, not inputs. Entries which declare outputs are up to date if the key
+    is unchanged and outputs are as written by the last run. File hashes are reused
+    while size and modification time of a file do not change.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(path) as f:
+                journal = json.load(f)
+        except FileNotFoundError:
+            journal = {}
+        self.entries = journal.get("entries", {})
+        self.files = journal.get("files", {})
+        self.sources = {}
+        # argument strings which were no existing files when keyed, by entry
+        self.missing = {}
+        self.lock = threading.Lock()
+
+
+    def file_hash(self, path: str):
+        """Content hash of file or directory tree, None if path does not exist"""
+        if os.path.isdir(path):
+            digest = hashlib.sha256()
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    digest.update(os.path.relpath(full, path).encode())
+                    digest.update(str(self.file_hash(full)).encode())
+            return digest.hexdigest()
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp = [st.st_size, st.st_mtime_ns]
+        cached = self.files.get(path)
+        if cached is not None and cached[:2] == stamp:
+            return cached[2]
+
+        digest = file_sha256(path)
+        with self.lock:
+            self.files[path] = stamp + [digest]
+        return digest
+
+
+    def source_hash(self, plugin_path: str):
+        """Hash of plugin sources and manifest, bytecode caches are ignored"""
+        if plugin_path not in self.sources:
+            digest = hashlib.sha256()
+            for root, dirs, files in os.walk(plugin_path):
+                dirs[:] = sorted(name for name in dirs if name != "__pycache__")
+                for name in sorted(files):
+                    if name.endswith(".py") or name == "manifest.yaml":
+                        full = os.path.join(root, name)
+                        digest.update(os.path.relpath(full, plugin_path).encode())
+                        digest.update(str(self.file_hash(full)).encode())
+            self.sources[plugin_path] = digest.hexdigest()
+        return self.sources[plugin_path]
+
+
+    def created(self, task):
+        """Files named in arguments which the entry created in earlier runs"""
+        entry = self.entries.get(task.name)
+        return set(entry.get("created", [])) if entry is not None else set()
+
+
+    def key(self, task, plugin_path: str):
+        """Hash of resolved arguments, referenced input files and plugin source"""
+        outputs = set(task.outputs) | self.created(task)
+        strings = set(walk_strings(task.kwargs))
+        with self.lock:
+            self.missing[task.name] = {value for value in strings if not os.path.isfile(value)}
+        inputs = sorted({value for value in strings if value not in outputs and os.path.isfile(value)} | set(task.inputs))
+
+        digest = hashlib.sha256()
+        digest.update(f"{task.plugin}.{task.entry}".encode())
+        digest.update(json.dumps(task.kwargs, sort_keys=True, default=str).encode())
+        for path in inputs:
+            digest.update(path.encode())
+            digest.update(str(self.file_hash(path)).encode())
+        digest.update(str(self.source_hash(plugin_path)).encode())
+        return digest.hexdigest()
+
+
+    def up_to_date(self, task, key: str) -> bool:
+        """Entry with declared outputs whose key and outputs did not change"""
+        entry = self.entries.get(task.name)
+        if not task.outputs or entry is None or entry["key"] != key:
+            return False
+        for path in set(task.outputs) | self.created(task):
+            recorded = entry["outputs"].get(path)
+            if recorded is None or self.file_hash(path) != recorded:
+                return False
+        return True
+
+
+    def record(self, task, key: str):
+        with self.lock:
+            missing = self.missing.pop(task.name, set())
+        created = sorted(self.created(task) | {path for path in missing if os.path.isfile(path)})
+        outputs = {path: self.file_hash(path) for path in set(task.outputs) | set(created)}
+        with self.lock:
+            self.entries[task.name] = {"key": key, "outputs": outputs, "created": created}
+            self.save()
+
+
+    def save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"entries": self.entries, "files": self.files}, f, indent=1)
+        os.replace(tmp, self.path)
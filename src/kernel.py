@@ -1,6 +1,9 @@
 import os
 from state import State
 from plugin import Plugin
+from scheduler import Task, check_graph, ordered, run_graph
+from profiler import Profiler, NullProfiler
+from journal import Journal
 
 class KernelException(Exception):
     pass
@@ -9,16 +12,89 @@ class InvalidConfig(KernelException):
     pass
 
 
+# sequence entry keys used by kernel, not passed to plugins
+SCHEDULING_KEYS = ("id", "after", "needs", "cpu", "inputs", "outputs")
+
+
 class Kernel:
     
-    def __init__(self, config: str):
+    def __init__(self, config: str, force_from: str = None, force_only: list = None, config_cache: bool = False):
         self.state = State()
-        self.state.load(config)
+        self.state.load(config, config_cache)
         self.plugins = {}
         try:
             self.sequence = self.state["sequence"]
         except KeyError:
             raise InvalidConfig("Cannot find sequence")
+        
+        # optional parallel execution
+        try:
+            self.parallel = self.state["parallel"]
+        except KeyError:
+            self.parallel = None
+        
+        # optional profiling, entries get the profiler through shared state
+        try:
+            profile = self.state["profile"] or {}
+            self.profiler = Profiler(profile.get("trace"), profile.get("summary")) if profile.get("enabled", True) else NullProfiler()
+        except KeyError:
+            self.profiler = NullProfiler()
+        self.state.share("profiler", self.profiler)
+        
+        # optional run journal, entries with unchanged key and outputs are skipped
+        try:
+            self.journal = Journal(self.state["journal"])
+        except KeyError:
+            self.journal = None
+        
+        self.tasks = self.make_tasks()
+        self.forced = self.forced_tasks(force_from, force_only or [])
+    
+    
+    def make_tasks(self):
+        """Splits sequence into tasks, entries without after/needs depend on the previous one"""
+        tasks = []
+        for index, command in enumerate(self.sequence):
+            key, value = list(command.items())[0]
+            plugin, entry = key.split(".")
+            kwargs = dict(value or {})
+            scheduling = {k: kwargs.pop(k) for k in SCHEDULING_KEYS if k in kwargs}
+            
+            after = scheduling.get("after", scheduling.get("needs"))
+            if after is None:
+                after = [tasks[-1].name] if tasks else []
+            elif isinstance(after, str):
+                after = [after]
+            
+            tasks.append(Task(
+                str(scheduling.get("id", index)),
+                plugin,
+                entry,
+                kwargs,
+                list(after),
+                int(scheduling.get("cpu", 1)),
+                [str(path) for path in scheduling.get("inputs", [])],
+                [str(path) for path in scheduling.get("outputs", [])],
+            ))
+        
+        try:
+            check_graph(tasks)
+        except ValueError as e:
+            raise InvalidConfig(str(e))
+        return tasks
+    
+    
+    def forced_tasks(self, force_from, force_only):
+        """Names of tasks executed regardless of journal, from force_from on and force_only"""
+        names = [task.name for task in ordered(self.tasks)]
+        for name in force_only + ([force_from] if force_from is not None else []):
+            if name not in names:
+                raise InvalidConfig(f"Unknown sequence entry \"{name}\"")
+        
+        forced = set(force_only)
+        if force_from is not None:
+            forced.update(names[names.index(force_from):])
+        return forced
     
     
     def load(self):
@@ -29,9 +105,49 @@ class Kernel:
             raise InvalidConfig("Cannot find plugins")
     
     
+    def check(self):
+        """Raises InvalidConfig if sequence uses unknown plugins or entries, imports nothing"""
+        for task in self.tasks:
+            if task.plugin not in self.plugins:
+                raise InvalidConfig(f"Plugin \"{task.plugin}\" of \"{task.name}\" is not in plugins")
+            if task.entry not in self.plugins[task.plugin].entries:
+                raise InvalidConfig(f"Entry \"{task.entry}\" of \"{task.name}\" not found in plugin \"{task.plugin}\"")
+    
+    
+    def import_times(self):
+        """Import time of each imported plugin in seconds"""
+        return {name: plugin.import_time for name, plugin in self.plugins.items() if plugin.import_time is not None}
+    
+    
+    def execute(self, task: Task):
+        plugin = self.plugins[task.plugin]
+        
+        # skipped entries do not import their plugin
+        if self.journal is not None:
+            key = self.journal.key(task, plugin.path)
+            if task.name not in self.forced and self.journal.up_to_date(task, key):
+                print(f"Skipping up to date \"{task.name}\" ({task.plugin}.{task.entry})")
+                return
+        
+        if plugin.module is None:
+            with self.profiler.span(f"import {task.plugin}", "import"):
+                plugin.import_module()
+        
+        with self.profiler.span(f"{task.plugin}.{task.entry}", "sequence", id=task.name):
+            plugin.execute(task.entry, task.kwargs, self.state)
+        
+        if self.journal is not None:
+            self.journal.record(task, key)
+    
+    
     def run(self):
-        for command in self.sequence:
-            key, value = list(command.items())[0]
-            plugin, entry = key.split(".")
-            self.plugins[plugin].execute(entry, value)
-    
\ No newline at end of file
+        try:
+            if self.parallel is None:
+                # declared dependencies may point forward in sequence
+                for task in ordered(self.tasks):
+                    self.execute(task)
+            else:
+                run_graph(self.tasks, self.execute, self.parallel.get("cores"), self.parallel.get("workers"))
+        finally:
+            self.profiler.close()
+    
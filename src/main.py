@@ -1,8 +1,23 @@
 import sys
+import argparse
 from kernel import Kernel
 
 if __name__ == "__main__":
-    kernel = Kernel(sys.argv[1])
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config")
+    parser.add_argument("--check", action="store_true", help="validate config without running")
+    parser.add_argument("--from", dest="force_from", help="run sequence entry with this id and following ones even if up to date")
+    parser.add_argument("--only", action="append", default=[], help="run sequence entry with this id even if up to date")
+    parser.add_argument("--config-cache", action="store_true", help="reuse parsed config, for configs whose YAML constructors do not depend on environment")
+    args = parser.parse_args()
+    
+    kernel = Kernel(args.config, args.force_from, args.only, args.config_cache)
     kernel.load()
+    kernel.check()
+    if args.check:
+        print(f"Config \"{args.config}\" is valid")
+        sys.exit(0)
+    
     kernel.run()
-    
\ No newline at end of file
+    for name, seconds in kernel.import_times().items():
+        print(f"Plugin \"{name}\" imported in {seconds:.3f} s")
@@ -1,7 +1,11 @@
 import os
 import sys
+import time
+import threading
 import yaml
 import importlib.util as iu
+from state import LOADER
+from inspect import signature
 
 
 class PluginException(Exception):
@@ -24,10 +28,14 @@ class EntryNotFoundException(PluginException):
 
 
 class Plugin:
+    """Plugin with eagerly read manifest, main script is imported on first execute"""
+    
     def __init__(self, path: str):
-        sys.path.append(path)
         self.path = path
         self.name = os.path.basename(path)
+        self.module = None
+        self.import_time = None
+        self.lock = threading.Lock()
         self.load()
     
     
@@ -38,7 +46,7 @@ class Plugin:
         try:
             # load manifest
             with open(os.path.join(self.path, "manifest.yaml")) as f:
-                self.manifest = yaml.load(f, Loader=yaml.UnsafeLoader)
+                self.manifest = yaml.load(f, Loader=LOADER)
         except FileNotFoundError:
             raise ManifestNotFoundException(f"Cannot find manifest for plugin \"{self.name}\"")
         
@@ -48,41 +56,63 @@ class Plugin:
         except KeyError:
             raise InvalidManifestException(f"Invalid manifest for plugin \"{self.name}\"")
         
-        # entry points
-        self.entries = {}
-        
-        if not os.path.exists(os.path.join(self.path, "main.py")):
-            raise MainScriptNotFoundException(f"Cannot find main script in \"{self.name}\" plugin")
-        
         try:
-            # load module
-            self.spec = iu.spec_from_file_location(
-                self.name, os.path.join(self.path, "main.py")
-            )
-            self.module = iu.module_from_spec(self.spec)
-            self.spec.loader.exec_module(self.module)
-        except Exception:
-            raise PluginException(f"Plugin \"{self.name}\" error")
-        
-        try:
-            # get entry points
-            for key in self.manifest["entries"]:
-                self.entries[key] = getattr(self.module, key)
+            # entry names, functions are resolved on import
+            self.entries = {key: None for key in self.manifest["entries"]}
         except KeyError:
             raise InvalidManifestException(f"Entry list not found in \"{self.name}\" plugin")
-        except AttributeError:
-            raise EntryNotFoundException(f"Entry \"{key}\" not found for plugin \"{self.name}\"")
         
+        if not os.path.exists(os.path.join(self.path, "main.py")):
+            raise MainScriptNotFoundException(f"Cannot find main script in \"{self.name}\" plugin")
     
-    def execute(self, entry: str, kwargs):
+    
+    def import_module(self):
+        """Imports main script and resolves entries, once"""
+        with self.lock:
+            if self.module is not None:
+                return
+            
+            start = time.perf_counter()
+            # plugin modules stay importable, spawned processes unpickle functions of them
+            path = os.path.abspath(self.path)
+            if path not in sys.path:
+                sys.path.append(path)
+            try:
+                # load module
+                spec = iu.spec_from_file_location(
+                    self.name, os.path.join(self.path, "main.py")
+                )
+                module = iu.module_from_spec(spec)
+                spec.loader.exec_module(module)
+            except Exception:
+                raise PluginException(f"Plugin \"{self.name}\" error")
+            
+            # get entry points
+            for key in self.entries:
+                try:
+                    self.entries[key] = getattr(module, key)
+                except AttributeError:
+                    raise EntryNotFoundException(f"Entry \"{key}\" not found for plugin \"{self.name}\"")
+            
+            self.module = module
+            self.import_time = time.perf_counter() - start
+    
+    
+    def execute(self, entry: str, kwargs, state=None):
+        if entry not in self.entries:
+            raise EntryNotFoundException(f"Entry \"{entry}\" not found for plugin \"{self.name}\"")
+        
+        self.import_module()
+        function = self.entries[entry]
+        
         try:
-            self.entries[entry](**kwargs)
+            # entries with state parameter get shared state
+            if "state" in signature(function).parameters:
+                function(state=state, **kwargs)
+            else:
+                function(**kwargs)
         except KeyError:
             raise EntryNotFoundException(f"Entry \"{entry}\" not found for plugin \"{self.name}\"")
         except Exception:
             if kwargs.get("strict", True):
                 raise 
-    
-    
-    
-    
\ No newline at end of file
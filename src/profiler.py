@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+class Profiler:
+    """Collects timed spans, writes Chrome trace (Perfetto) JSON and a summary table"""
+
+    def __init__(self, trace: str = None, summary: str = None):
+        self.trace = trace
+        self.summary_path = summary
+        self.origin = time.perf_counter()
+        self.events = []
+        # name -> [calls, seconds]
+        self.totals = {}
+        # name -> (value, unit)
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+
+    @contextmanager
+    def span(self, name: str, category: str = "kernel", **args):
+        """Times the block as one trace event"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, category, start, time.perf_counter() - start, args)
+
+
+    def complete(self, name: str, category: str, start: float, seconds: float, args=None):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": seconds * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with self.lock:
+            self.events.append(event)
+        self.add(name, seconds)
+
+
+    def add(self, name: str, seconds: float, calls: int = 1):
+        """Adds time measured elsewhere to summary, without trace event"""
+        with self.lock:
+            total = self.totals.setdefault(name, [0, 0.0])
+            total[0] += calls
+            total[1] += seconds
+
+
+    def metric(self, name: str, value: float, unit: str = ""):
+        self.metrics[name] = (value, unit)
+
+
+    def summary(self) -> str:
+        wall = time.perf_counter() - self.origin
+        lines = [f"{'span':<40} {'calls':>8} {'total, s':>10} {'mean, ms':>10} {'wall, %':>8}"]
+        for name, (calls, seconds) in sorted(self.totals.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<40} {calls:>8} {seconds:>10.3f} {seconds / calls * 1e3:>10.3f} {seconds / wall * 100:>8.1f}")
+        for name, (value, unit) in self.metrics.items():
+            lines.append(f"{name:<40} {value:>.4g} {unit}")
+        return "\n".join(lines)
+
+
+    def close(self):
+        """Writes trace file and summary"""
+        if self.trace is not None:
+            with open(self.trace, "w") as f:
+                json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+        if self.summary_path is not None:
+            with open(self.summary_path, "w") as f:
+                f.write(self.summary() + "\n")
+        else:
+            print(self.summary())
+
+
+class NullProfiler:
+    """Profiler used when profiling is disabled, does nothing"""
+
+    _null = nullcontext()
+
+    def span(self, name: str, category: str = "kernel", **args):
+        return self._null
+
+    def complete(self, name: str, category: str, start: float, seconds: float, args=None):
+        pass
+
+    def add(self, name: str, seconds: float, calls: int = 1):
+        pass
+
+    def metric(self, name: str, value: float, unit: str = ""):
+        pass
+
+    def close(self):
+        pass
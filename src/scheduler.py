@@ -0,0 +1,87 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class Task:
+    """Sequence entry with its dependencies and core demand"""
+
+    def __init__(self, name: str, plugin: str, entry: str, kwargs: dict, after: list, cpu: int, inputs: list = None, outputs: list = None):
+        self.name = name
+        self.plugin = plugin
+        self.entry = entry
+        self.kwargs = kwargs
+        self.after = after
+        self.cpu = cpu
+        # files used and written by entry, for run journal
+        self.inputs = inputs or []
+        self.outputs = outputs or []
+
+
+def check_graph(tasks):
+    """Raises ValueError on unknown dependencies or cycles"""
+    names = {task.name for task in tasks}
+    if len(names) != len(tasks):
+        raise ValueError("Duplicate sequence ids")
+
+    for task in tasks:
+        for dependency in task.after:
+            if dependency not in names:
+                raise ValueError(f"Unknown dependency \"{dependency}\" of \"{task.name}\"")
+
+    # Kahn's algorithm
+    after = {task.name: set(task.after) for task in tasks}
+    while after:
+        ready = [name for name, dependencies in after.items() if not dependencies]
+        if not ready:
+            raise ValueError(f"Dependency cycle between {sorted(after)}")
+        for name in ready:
+            del after[name]
+        for dependencies in after.values():
+            dependencies.difference_update(ready)
+
+
+def ordered(tasks):
+    """Tasks in stable topological order, earliest ready task in sequence order first"""
+    pending = list(tasks)
+    done = set()
+    order = []
+    while pending:
+        task = next(task for task in pending if all(name in done for name in task.after))
+        pending.remove(task)
+        done.add(task.name)
+        order.append(task)
+    return order
+
+
+def run_graph(tasks, execute, cores=None, workers=None):
+    """Runs tasks on a thread pool as soon as dependencies are done and cores are free
+
+    Tasks are started in sequence order. A task needing more than cores runs alone.
+    The first error stops starting new tasks and is raised after running ones finish.
+    """
+    cores = cores or os.cpu_count()
+    pending = list(tasks)
+    done = set()
+    running = {}
+    used = 0
+    error = None
+
+    with ThreadPoolExecutor(max_workers=workers or cores) as pool:
+        while running or (pending and error is None):
+            if error is None:
+                for task in list(pending):
+                    if all(name in done for name in task.after) and (used + task.cpu <= cores or not running):
+                        running[pool.submit(execute, task)] = task
+                        used += task.cpu
+                        pending.remove(task)
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                used -= task.cpu
+                if future.exception() is not None and error is None:
+                    error = future.exception()
+                done.add(task.name)
+
+    if error is not None:
+        raise error
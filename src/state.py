@@ -1,9 +1,20 @@
 import yaml
 import os
+import pickle
+import hashlib
 import importlib.util as iu
+from functools import lru_cache
 from inspect import getmembers, isfunction
 
 
+# C libyaml loader if available
+LOADER = getattr(yaml, "CUnsafeLoader", yaml.UnsafeLoader)
+# parsed configs keyed by hash of config and representers file
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "u-xe-bubble", "config")
+# cached parses kept, least recently used ones are removed
+CACHE_ENTRIES = 64
+
+
 class ConfigException(Exception):
     pass
 
@@ -11,46 +22,109 @@ class YamlRepresentersFileException(ConfigException):
     pass
 
 
+def prune_cache(keep: int = None):
+    """Removes least recently used cached parses beyond keep, CACHE_ENTRIES by default"""
+    keep = CACHE_ENTRIES if keep is None else keep
+    try:
+        names = [name for name in os.listdir(CACHE_DIR) if name.endswith(".pickle")]
+    except FileNotFoundError:
+        return
+    paths = sorted((os.path.join(CACHE_DIR, name) for name in names), key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@lru_cache(maxsize=None)
+def split(key: str):
+    return tuple(key.split("|"))
+
+
 class State:
     """Stores state"""
     
     def __init__(self):
         self._dict = {}
+        # objects passed between plugin entries, not part of config
+        self._shared = {}
     
     
-    def load(self, path: str):
-        """Loads config by path"""
-        with open(path) as f:
-            line = f.readline()
-            if line[0] == "#":
-                repr = line.split("#")[1].strip()
-                try:
-                    # load functions
-                    spec = iu.spec_from_file_location("repr", repr)
-                    module = iu.module_from_spec(spec)
-                    spec.loader.exec_module(module)
-                    func = getmembers(module, isfunction)
-                    
-                    for name, obj in func:
-                        if name.startswith("_"):
-                            continue
-                        yaml.add_constructor(f"!{name}", obj)
-                except Exception:
-                    raise YamlRepresentersFileException(f"Incorrect \"{repr}\" YAML representers file")
+    def load(self, path: str, cache: bool = False):
+        """Loads config by path, with cache reuses parse of unchanged config and representers
+
+        Cached parses skip YAML constructors, so the cache is for configs whose
+        constructors return the same values on every run.
+        """
+        with open(path, "rb") as f:
+            text = f.read()
+        
+        line = text.split(b"\n", 1)[0].decode()
+        repr = line.split("#")[1].strip() if line.startswith("#") else None
+        representers = b""
+        try:
+            if repr is not None:
+                with open(repr, "rb") as f:
+                    representers = f.read()
+        except OSError:
+            raise YamlRepresentersFileException(f"Incorrect \"{repr}\" YAML representers file")
+        
+        key = hashlib.sha256(text + b"\0" + representers + yaml.__version__.encode()).hexdigest()
+        cache_path = os.path.join(CACHE_DIR, f"{key}.pickle")
+        if cache:
+            try:
+                with open(cache_path, "rb") as f:
+                    self._dict = pickle.load(f)
+                # mark as recently used
+                os.utime(cache_path)
+                return
+            except Exception:
+                # missing or unreadable cache entry, parse again
+                pass
+        
+        if repr is not None:
+            try:
+                # load functions
+                spec = iu.spec_from_file_location("repr", repr)
+                module = iu.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                func = getmembers(module, isfunction)
+                
+                for name, obj in func:
+                    if name.startswith("_"):
+                        continue
+                    yaml.add_constructor(f"!{name}", obj, Loader=LOADER)
+            except Exception:
+                raise YamlRepresentersFileException(f"Incorrect \"{repr}\" YAML representers file")
             
         try:
             # load config
-            with open(path) as f:
-                self._dict = yaml.load(f, Loader=yaml.loader.UnsafeLoader)
+            self._dict = yaml.load(text, Loader=LOADER)
         except Exception:
             raise ConfigException(f"Incorrect config \"{path}\"")
         
+        if cache:
+            tmp = f"{cache_path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                with open(tmp, "wb") as f:
+                    pickle.dump(self._dict, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, cache_path)
+                prune_cache()
+            except Exception:
+                # config objects which cannot be pickled are not cached
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+        
     
     def __getitem__(self, key):
         try:
             d = self._dict
             
-            for k in key.split("|"):
+            for k in split(key):
                 d = d[k]
                 
             return d
@@ -61,7 +135,7 @@ class State:
     
     def __setitem__(self, key, value):
         try:
-            spl = key.split("|")
+            spl = split(key)
             d = self._dict
             
             for k in spl[:-1]:
@@ -71,6 +145,19 @@ class State:
             
         except (KeyError, TypeError):
             raise KeyError(f"No such key \"{key}\"")
+    
+    
+    def share(self, key: str, value):
+        """Stores object for later plugin entries"""
+        self._shared[key] = value
+    
+    
+    def shared(self, key: str):
+        """Returns object stored by share"""
+        try:
+            return self._shared[key]
+        except KeyError:
+            raise KeyError(f"No shared object \"{key}\"")
         
         
 def join(loader, node):
@@ -0,0 +1,49 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from plugin import Plugin
+from profiler import NullProfiler
+from state import State
+
+
+@pytest.fixture(scope="session")
+def openmm_plugin():
+    """openmm plugin module, imported as kernel does"""
+    pytest.importorskip("openmm")
+    pytest.importorskip("ovito")
+    pytest.importorskip("tqdm")
+    plugin = Plugin(os.path.join(ROOT, "plugins", "openmm"))
+    plugin.import_module()
+    return plugin.module
+
+
+@pytest.fixture
+def state():
+    state = State()
+    state.share("profiler", NullProfiler())
+    return state
+
+
+@pytest.fixture
+def structure(tmp_path):
+    """Small BCC box as handed off structure file"""
+    a = 3.47
+    grid = np.stack(np.meshgrid(*[np.arange(2)] * 3, indexing="ij"), axis=-1).reshape(-1, 3).astype(float)
+    positions = np.concatenate([grid, grid + 0.5]) * a
+    rng = np.random.default_rng(0)
+    path = tmp_path / "structure.npz"
+    np.savez(
+        path,
+        cell=np.eye(3) * 2 * a,
+        positions=positions,
+        velocities=rng.normal(0, 0.01, positions.shape),
+        masses=np.full(len(positions), 238.0),
+        types=np.ones(len(positions), dtype=int),
+    )
+    return str(path)
@@ -0,0 +1,26 @@
+import multiprocessing as mp
+import sys
+
+import numpy as np
+
+
+SCRIPT = """
+def count(frames):
+    steps = [frame.step for frame in frames]
+    with open({output!r}, "w") as f:
+        f.write(" ".join(map(str, steps)))
+"""
+
+
+def test_process_stream_with_spawn(openmm_plugin, monkeypatch, tmp_path):
+    analysis = sys.modules["analysis"]
+    # default start method on macOS, forkserver behaves alike
+    monkeypatch.setattr(analysis, "mp", mp.get_context("spawn"))
+    script = tmp_path / "script.py"
+    script.write_text(SCRIPT.format(output=str(tmp_path / "steps.txt")))
+
+    stream = analysis.open_stream(str(script), "count", np.ones(4, dtype=int), np.eye(3), "process")
+    for step in range(3):
+        stream.send(step, np.zeros((4, 3)), np.zeros((4, 3)), {"step": step})
+    stream.close()
+    assert (tmp_path / "steps.txt").read_text() == "0 1 2"
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def autotune(openmm_plugin):
+    import autotune
+    return autotune
+
+
+@pytest.fixture
+def system():
+    mm = pytest.importorskip("openmm")
+    system = mm.System()
+    for _ in range(4):
+        system.addParticle(1.0)
+    return system
+
+
+def choose(autotune, system, cache, **kwargs):
+    import openmm as mm
+    positions = [mm.Vec3(i, 0, 0) for i in range(4)]
+    return autotune.choose(system, mm.VerletIntegrator(0.001), positions, steps=2, cache=str(cache), **kwargs)
+
+
+def test_user_properties_win(autotune, system, tmp_path):
+    name, properties = choose(autotune, system, tmp_path / "platforms.json", names=["CPU"], threads=[1, 2], properties={"Threads": "1"})
+    assert (name, properties) == ("CPU", {"Threads": "1"})
+    decision, = json.loads((tmp_path / "platforms.json").read_text()).values()
+    assert len(decision["trials"]) == 1
+
+
+def test_decisions_cached_per_candidates(autotune, system, tmp_path):
+    cache = tmp_path / "platforms.json"
+    choose(autotune, system, cache, names=["Reference"])
+    choose(autotune, system, cache, names=["Reference"])
+    assert len(json.loads(cache.read_text())) == 1
+
+    # another candidate set is timed again
+    name, _ = choose(autotune, system, cache, names=["CPU"], threads=[1])
+    assert name == "CPU"
+    assert len(json.loads(cache.read_text())) == 2
+
+    # known system digest replaces hashing the System
+    choose(autotune, system, cache, names=["Reference"], digest="build")
+    assert any(":build:" in key for key in json.loads(cache.read_text()))
@@ -0,0 +1,46 @@
+import json
+
+
+def configs(structure, out, run_steps):
+    init = {
+        "configuration": structure,
+        "integrator": {"type": "LangevinMiddleIntegrator", "arguments": [300, 1, 0.001]},
+        "forces": [{"CMMotionRemover": {}}],
+        "platform_name": "Reference",
+        "platform_properties": {},
+        "checkpoint": "auto",
+        "checkpoint_template": f"{out}/{{i}}.chk",
+    }
+    simulate = {
+        "average_steps": 5,
+        "skip_steps": 5,
+        "run_steps": run_steps,
+        "checkpoint_steps": 20,
+        "checkpoint_template": f"{out}/{{i}}.chk",
+        "thermo": f"{out}/thermo.csv",
+        "thermo_format": "npz",
+        "trajectory_backend": "npy",
+        "trajectory_path": f"{out}/trajectory",
+        "analyzing_script": None,
+    }
+    return init, simulate
+
+
+def saved_steps(out):
+    with open(out / "checkpoints.json") as f:
+        return [entry["step"] for entry in json.load(f)]
+
+
+def test_restart_saves_checkpoints_every_checkpoint_steps(openmm_plugin, state, structure, tmp_path):
+    init, simulate = configs(structure, tmp_path, 40)
+    openmm_plugin.init(state=state, **init)
+    openmm_plugin.simulate(state=state, **simulate)
+    assert saved_steps(tmp_path) == [20, 40]
+
+    openmm_plugin.init(state=state, **init)
+    assert openmm_plugin._step == 40
+    openmm_plugin.simulate(state=state, **simulate)
+    assert saved_steps(tmp_path) == [20, 40, 60, 80]
+    # thermo is flushed at checkpoints only, chunks cover two windows
+    chunks = sorted(path.name for path in (tmp_path / "thermo.csv.npz.d").iterdir())
+    assert chunks == ["0-10.npz", "20-30.npz", "40-50.npz", "60-70.npz"]
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+
+def init_config(structure, out, **kwargs):
+    return {
+        "configuration": structure,
+        "integrator": {"type": "LangevinMiddleIntegrator", "arguments": [300, 1, 0.001]},
+        "forces": [{"CMMotionRemover": {}}],
+        "platform_name": "Reference",
+        "platform_properties": {},
+        "checkpoint": "auto",
+        "checkpoint_template": f"{out}/r{{r}}/{{i}}.chk",
+        "ensemble": {"replicas": 2, "temperatures": [300, 600]},
+        **kwargs,
+    }
+
+
+def simulate_config(out, **kwargs):
+    return {
+        "average_steps": 5,
+        "skip_steps": 5,
+        "run_steps": 20,
+        "checkpoint_steps": 10,
+        "checkpoint_template": f"{out}/r{{r}}/{{i}}.chk",
+        "thermo": f"{out}/r{{r}}/thermo.csv",
+        "ensemble_thermo": f"{out}/ensemble.csv",
+        "trajectory_backend": "npy",
+        "trajectory_path": f"{out}/r{{r}}/trajectory",
+        "analyzing_script": None,
+        **kwargs,
+    }
+
+
+def positions(replica):
+    return replica.context.getState(getPositions=True).getPositions(asNumpy=True)._value
+
+
+def test_replicas_restart_from_own_checkpoints(openmm_plugin, state, structure, tmp_path):
+    for r in range(2):
+        (tmp_path / f"r{r}").mkdir()
+
+    openmm_plugin.init(state=state, **init_config(structure, tmp_path))
+    openmm_plugin.simulate(state=state, **simulate_config(tmp_path))
+    final = [positions(replica) for replica in openmm_plugin._replicas]
+    assert not np.allclose(final[0], final[1])
+
+    openmm_plugin.init(state=state, **init_config(structure, tmp_path))
+    assert openmm_plugin._step == 20
+    for r, replica in enumerate(openmm_plugin._replicas):
+        np.testing.assert_allclose(positions(replica), final[r])
+
+
+def test_shared_replica_paths_are_rejected(openmm_plugin, state, structure, tmp_path):
+    with pytest.raises(ValueError, match="checkpoint_template"):
+        openmm_plugin.init(state=state, **init_config(structure, tmp_path, checkpoint_template=f"{tmp_path}/{{i}}.chk"))
+
+    openmm_plugin.init(state=state, **init_config(structure, tmp_path, checkpoint=None))
+    with pytest.raises(ValueError, match="thermo"):
+        openmm_plugin.simulate(state=state, **simulate_config(tmp_path, thermo=f"{tmp_path}/thermo.csv"))
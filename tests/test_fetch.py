@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plugins", "tree"))
+
+import fetch
+
+
+def test_duplicate_destinations_rejected(tmp_path):
+    (tmp_path / "out").mkdir()
+    pairs = [
+        {"file:///a/potential.fs": str(tmp_path / "out")},
+        {"file:///b/potential.fs": str(tmp_path / "out" / "potential.fs")},
+    ]
+    with pytest.raises(ValueError, match="more than once"):
+        fetch.install(pairs)
+
+
+@pytest.mark.parametrize("link", ["hardlink", "reflink", "copy"])
+def test_cached_download_placed_without_leftovers(tmp_path, link):
+    source = tmp_path / "potential.fs"
+    source.write_bytes(b"potential")
+    (tmp_path / "out").mkdir()
+
+    actions = fetch.install([{source.as_uri(): str(tmp_path / "out")}], cache=str(tmp_path / "cache"), link=link)
+    assert actions == {str(tmp_path / "out" / "potential.fs"): "downloaded"}
+    assert os.listdir(tmp_path / "out") == ["potential.fs"]
+    assert (tmp_path / "out" / "potential.fs").read_bytes() == b"potential"
+
+    actions = fetch.install([{source.as_uri(): str(tmp_path / "out")}], cache=str(tmp_path / "cache"), link=link)
+    assert list(actions.values()) == ["skipped"]
+
+
+def test_uncached_download_checksum_mismatch_leaves_nothing(tmp_path):
+    source = tmp_path / "potential.fs"
+    source.write_bytes(b"potential")
+    (tmp_path / "out").mkdir()
+
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        fetch.install([{source.as_uri(): {"path": str(tmp_path / "out"), "sha256": "0" * 64}}])
+    assert os.listdir(tmp_path / "out") == []
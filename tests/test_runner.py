@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plugins", "lammps"))
+
+import runner
+
+# stands in for LAMMPS, writes two thermo blocks with different columns to -log
+FAKE_LAMMPS = """
+import sys
+log = sys.argv[sys.argv.index("-log") + 1]
+with open(log, "w") as f:
+    f.write("Step Temp PotEng\\n")
+    for step in range(0, 50, 10):
+        f.write(f"{step} 300.0 -1.5\\n")
+    f.write("Loop time of 1.0\\n")
+    f.write("Step Temp\\n")
+    for step in range(50, 80, 10):
+        f.write(f"{step} 310.0\\n")
+    f.write("Loop time of 1.0\\n")
+"""
+
+
+def test_parquet_thermo_written_in_chunks(tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    (tmp_path / "lmp.py").write_text(FAKE_LAMMPS)
+    (tmp_path / "in.lmp").write_text("run {steps}\n")
+    job = runner.Job("0", {
+        "executable": f"{sys.executable} {tmp_path / 'lmp.py'}",
+        "script": str(tmp_path / "in.lmp"),
+        "script_save": str(tmp_path / "in.saved.lmp"),
+        "variables": {"steps": 70},
+        "log": str(tmp_path / "log.lammps"),
+        "thermo_parquet": str(tmp_path / "thermo.parquet.d"),
+        "thermo_flush_rows": 2,
+    })
+    runner.run([job], cores=1, poll_interval=0.01)
+
+    names = sorted(os.listdir(tmp_path / "thermo.parquet.d"), key=lambda name: int(name.split("-")[0]))
+    # chunks end at flush_rows and where columns change
+    assert names == ["0-1.parquet", "2-3.parquet", "4-4.parquet", "5-6.parquet", "7-7.parquet"]
+    tables = [pd.read_parquet(tmp_path / "thermo.parquet.d" / name) for name in names]
+    assert [int(step) for table in tables for step in table["Step"]] == list(range(0, 80, 10))
+    assert all(table["Step"].dtype == "int64" for table in tables)
+    assert list(tables[-1].columns) == ["run", "Step", "Temp"]
@@ -0,0 +1,33 @@
+import os
+
+import state as state_module
+from state import State
+
+
+def write_config(tmp_path):
+    representers = tmp_path / "representers.py"
+    representers.write_text("import os\n\ndef env(loader, node):\n    return os.environ[loader.construct_scalar(node)]\n")
+    config = tmp_path / "config.yaml"
+    config.write_text(f"# {representers}\nrun: !env RUNID\n")
+    return str(config)
+
+
+def test_constructors_run_without_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(state_module, "CACHE_DIR", str(tmp_path / "cache"))
+    config = write_config(tmp_path)
+    for runid in ("1", "2"):
+        monkeypatch.setenv("RUNID", runid)
+        loaded = State()
+        loaded.load(config)
+        assert loaded["run"] == runid
+    assert not os.path.exists(tmp_path / "cache")
+
+
+def test_cache_is_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(state_module, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(state_module, "CACHE_ENTRIES", 3)
+    for i in range(5):
+        config = tmp_path / f"{i}.yaml"
+        config.write_text(f"value: {i}\n")
+        State().load(str(config), cache=True)
+    assert len(os.listdir(tmp_path / "cache")) == 3
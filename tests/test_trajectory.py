@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def trajectory(openmm_plugin):
+    import trajectory
+    return trajectory
+
+
+@pytest.mark.parametrize("backend", ["npy", "hdf5"])
+def test_reader_of_trajectory_without_frames(trajectory, backend, tmp_path):
+    if backend == "hdf5":
+        pytest.importorskip("h5py")
+    path = str(tmp_path / "trajectory")
+    trajectory.open_writer(backend, path, np.ones(4, dtype=int)).close()
+
+    reader = trajectory.TrajectoryReader(path)
+    assert len(reader) == 0
+    assert reader.cell is None
+    with pytest.raises(KeyError):
+        reader.find(0)
+    reader.close()
@@ -0,0 +1,36 @@
+import os
+import stat
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plugins", "tree"))
+
+import materialize
+
+
+MODES = ["755", "0755", "00755", "2770", "u=rwx", "g=u", "o=g", "a-w", "u+s", "g-s", "g=rxs", "+X", "=r", "go=", "u=rw,g=u-w"]
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("kind", ["dir", "file"])
+def test_parse_mode_matches_chmod(tmp_path, mode, kind):
+    path = tmp_path / "x"
+    path.mkdir() if kind == "dir" else path.touch()
+    os.chmod(path, 0o2750)
+    subprocess.run(["chmod", mode, str(path)], check=True)
+    expected = stat.S_IMODE(os.stat(path).st_mode)
+    assert materialize.parse_mode(mode, 0o2750 | (stat.S_IFDIR if kind == "dir" else stat.S_IFREG), kind == "dir") == expected
+
+
+def test_create_restores_removed_entries(tmp_path):
+    structure = [{str(tmp_path).lstrip("/"): [{"out": ["a"]}]}]
+    manifest = str(tmp_path / "manifest.json")
+    materialize.create(structure, True, manifest)
+    assert (tmp_path / "out" / "a").is_file()
+
+    (tmp_path / "out" / "a").unlink()
+    (tmp_path / "out").rmdir()
+    materialize.create(structure, True, manifest)
+    assert (tmp_path / "out" / "a").is_file()